@@ -0,0 +1,275 @@
+# ##### BEGIN GPL LICENSE BLOCK #####
+#
+#  This program is free software; you can redistribute it and/or
+#  modify it under the terms of the GNU General Public License
+#  as published by the Free Software Foundation; either version 2
+#  of the License, or (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with this program; if not, write to the Free Software Foundation,
+#  Inc., 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301, USA.
+#
+# ##### END GPL LICENSE BLOCK #####
+
+# <pep8 compliant>
+
+
+# ----------------------------------------------------------------------------
+"""Benchmark of CPJ import stages on synthetic files
+
+Usage:
+    python3 benchmarks/bench_import.py --tris 10000 100000
+    blender --background --python benchmarks/bench_import.py -- --tris 10000
+
+Without Blender only decoding stages are timed, inside Blender mesh
+build and UV assignment are timed too. Results are appended to a JSON
+lines history file and compared with the best earlier run of the same
+case and runner, slower stages are reported as regressions.
+"""
+
+import os
+import sys
+import numpy
+import json
+import time
+import tempfile
+import platform
+import subprocess
+import argparse
+
+try:
+    import bpy
+except ImportError:
+    bpy = None
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+if bpy is not None:
+    sys.path.insert(0, ROOT)
+    from io_mesh_cannibal import cpj, import_cpj
+else:
+    sys.path.insert(0, os.path.join(ROOT, "io_mesh_cannibal"))
+    import cpj
+    import_cpj = None
+
+import synth_cpj  # noqa: E402
+
+
+# ----------------------------------------------------------------------------
+BENCH_STAGES = ("scan", "strings", "geo", "srf", "frm", "mesh", "uv")
+
+
+# ----------------------------------------------------------------------------
+def runner():
+    if bpy is not None:
+        return "blender %s" % bpy.app.version_string
+    return "python %s" % platform.python_version()
+
+
+# ----------------------------------------------------------------------------
+def revision():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=ROOT,
+            capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return ""
+
+
+# ----------------------------------------------------------------------------
+def decode_all(directory, magic):
+    # bypass decode cache, every run decodes from scratch
+    decoder = cpj.CPJ_DECODERS[magic]
+    return [decoder(directory, chunk) for chunk in directory.by_type(magic)]
+
+
+# ----------------------------------------------------------------------------
+def geo_arrays(geo):
+    """Positions and face corners gathered as on mesh build"""
+    positions = geo.verts["refPosition"][:, (0, 2, 1)].astype(numpy.float32)
+    faces = geo.edges["tailVertex"][geo.tris["edgeRing"]].astype(numpy.int32)
+    return positions, faces
+
+
+# ----------------------------------------------------------------------------
+def srf_loop_uvs(srf):
+    """UVs gathered per loop as on UV assignment"""
+    uv_index = srf.tris["uvIndex"]
+    loop_uvs = numpy.empty(uv_index.shape + (2,), numpy.float32)
+    loop_uvs[..., 0] = srf.uvs["u"][uv_index]
+    loop_uvs[..., 1] = 1.0 - srf.uvs["v"][uv_index]
+    return loop_uvs
+
+
+# ----------------------------------------------------------------------------
+def bench_file(filepath, repeat=3):
+    """Time import stages of file, return best time of each stage"""
+    best = {}
+
+    def lap(stage, start):
+        now = time.perf_counter()
+        best[stage] = min(best.get(stage, now - start), now - start)
+        return now
+
+    for i in range(repeat):
+        start = time.perf_counter()
+        directory = cpj.CpjFile(filepath)
+        start = lap("scan", start)
+
+        decode_all(directory, cpj.CPJ_MAC_MAGIC)
+        start = lap("strings", start)
+
+        # decoded arrays are lazy views, time the gathers done on import
+        geos = decode_all(directory, cpj.CPJ_GEO_MAGIC)
+        geo_data = [geo_arrays(geo) for geo in geos]
+        start = lap("geo", start)
+
+        srfs = decode_all(directory, cpj.CPJ_SRF_MAGIC)
+        for srf in srfs:
+            srf_loop_uvs(srf)
+        start = lap("srf", start)
+
+        for frm in decode_all(directory, cpj.CPJ_FRM_MAGIC):
+            for index in range(len(frm.frames)):
+                frm.positions(index)
+        start = lap("frm", start)
+
+        if bpy is not None:
+            meshes = []
+            for geo, (positions, faces) in zip(geos, geo_data):
+                mesh_data = bpy.data.meshes.new(geo.name)
+                import_cpj.mesh_from_arrays(mesh_data, positions, faces)
+                meshes.append(mesh_data)
+            start = lap("mesh", start)
+
+            for mesh_data, srf in zip(meshes, srfs):
+                import_cpj.uvs_from_arrays(mesh_data, srf.name, srf.uvs,
+                                           srf.tris["uvIndex"])
+            start = lap("uv", start)
+
+            for mesh_data in meshes:
+                bpy.data.meshes.remove(mesh_data)
+
+        del geos, geo_data, srfs
+        directory.close()
+
+    return best
+
+
+# ----------------------------------------------------------------------------
+def load_history(filepath):
+    history = []
+    if os.path.exists(filepath):
+        with open(filepath) as handle:
+            for line in handle:
+                if line.strip():
+                    history.append(json.loads(line))
+    return history
+
+
+# ----------------------------------------------------------------------------
+def regressions(history, record, threshold, min_delta=0.001):
+    """Stages slower than best earlier run of the same case and runner"""
+    found = []
+    earlier = [r for r in history
+               if r["case"] == record["case"] and r["runner"] == record["runner"]]
+    for stage, seconds in record["stages"].items():
+        times = [r["stages"][stage] for r in earlier if stage in r["stages"]]
+        if (times and seconds > min(times) * (1.0 + threshold)
+                and seconds - min(times) > min_delta):
+            found.append((stage, min(times), seconds))
+    return found
+
+
+# ----------------------------------------------------------------------------
+def main(argv=None):
+    if argv is None and bpy is not None:
+        argv = sys.argv[sys.argv.index("--") + 1:] if "--" in sys.argv else []
+
+    parser = argparse.ArgumentParser(
+        description="Benchmark CPJ import stages on synthetic files")
+    parser.add_argument("--tris", type=int, nargs="+",
+                        default=[10000, 100000, 1000000],
+                        help="triangle counts of benchmarked files")
+    parser.add_argument("--textures", type=int, default=4)
+    parser.add_argument("--frames", type=int, default=8)
+    parser.add_argument("--commands", type=int, default=100)
+    parser.add_argument("--compress", action="store_true",
+                        help="byte-compress vertex frames")
+    parser.add_argument("--repeat", type=int, default=3,
+                        help="runs per file, best time is kept")
+    parser.add_argument("--workdir",
+                        default=os.path.join(tempfile.gettempdir(),
+                                             "io_mesh_cannibal_bench"),
+                        help="directory of generated files")
+    parser.add_argument("--history",
+                        default=os.path.join(ROOT, "benchmarks",
+                                             "history.jsonl"),
+                        help="JSON lines file of earlier results")
+    parser.add_argument("--threshold", type=float, default=0.2,
+                        help="relative slowdown reported as regression")
+    parser.add_argument("--min-delta", type=float, default=1.0,
+                        help="slowdown in ms ignored as noise")
+    parser.add_argument("--no-history", action="store_true",
+                        help="do not record results")
+    args = parser.parse_args(argv)
+
+    os.makedirs(args.workdir, exist_ok=True)
+    history = load_history(args.history)
+    failed = 0
+
+    for tris in args.tris:
+        case = "tris=%d textures=%d frames=%d commands=%d" % (
+            tris, args.textures, args.frames, args.commands)
+        filename = "synth_%d_%d_%d_%d" % (
+            tris, args.textures, args.frames, args.commands)
+        if args.compress:
+            case += " compress"
+            filename += "_c"
+        filepath = os.path.join(args.workdir, filename + ".cpj")
+
+        if not os.path.exists(filepath):
+            cpj.write_file(filepath, synth_cpj.synth_chunks(
+                tris, textures=args.textures, frames=args.frames,
+                commands=args.commands, compress=args.compress))
+
+        stages = bench_file(filepath, args.repeat)
+        record = {
+            "time": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "revision": revision(),
+            "runner": runner(),
+            "case": case,
+            "bytes": os.path.getsize(filepath),
+            "stages": stages,
+        }
+
+        print("%s (%d bytes)" % (case, record["bytes"]))
+        for stage in BENCH_STAGES:
+            if stage in stages:
+                print("  %-8s %10.2f ms" % (stage, stages[stage] * 1000.0))
+
+        for stage, before, after in regressions(
+                history, record, args.threshold, args.min_delta / 1000.0):
+            print("  REGRESSION %s: %.2f ms -> %.2f ms" % (
+                stage, before * 1000.0, after * 1000.0))
+            failed += 1
+
+        if not args.no_history:
+            with open(args.history, "a") as handle:
+                handle.write(json.dumps(record) + "\n")
+
+    return 1 if failed else 0
+
+
+# ----------------------------------------------------------------------------
+if __name__ == "__main__":
+    sys.exit(main())
+
+
+# EoF
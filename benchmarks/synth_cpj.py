@@ -0,0 +1,166 @@
+# ##### BEGIN GPL LICENSE BLOCK #####
+#
+#  This program is free software; you can redistribute it and/or
+#  modify it under the terms of the GNU General Public License
+#  as published by the Free Software Foundation; either version 2
+#  of the License, or (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with this program; if not, write to the Free Software Foundation,
+#  Inc., 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301, USA.
+#
+# ##### END GPL LICENSE BLOCK #####
+
+# <pep8 compliant>
+
+
+# ----------------------------------------------------------------------------
+"""Generator of valid synthetic CPJ files for benchmarks
+
+Usage:
+    python3 benchmarks/synth_cpj.py out.cpj --tris 1000000 --frames 8
+
+CPJ stores edge indices in 16 bits, so a single geometry holds at most
+about 21k triangles. Larger triangle counts are split into several
+GEO/SRF/FRM chunk sets named synth000, synth001 and so on.
+"""
+
+import os
+import sys
+import math
+import argparse
+import numpy
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(
+    os.path.abspath(__file__))), "io_mesh_cannibal"))
+
+import cpj  # noqa: E402
+
+
+# ----------------------------------------------------------------------------
+SYNTH_MAX_TRIS = 20000
+
+
+# ----------------------------------------------------------------------------
+def grid(num_tris, width=0, rng=None):
+    """Grid mesh positions, faces and UVs with given number of triangles"""
+    cols = width or max(1, int(math.sqrt(num_tris / 2)))
+    rows = max(1, -(-num_tris // (2 * cols)))
+
+    xs, ys = numpy.meshgrid(numpy.arange(cols + 1, dtype=numpy.float32),
+                            numpy.arange(rows + 1, dtype=numpy.float32))
+    positions = numpy.stack((xs.ravel(), numpy.zeros(xs.size, numpy.float32),
+                             ys.ravel()), axis=1)
+    if rng is not None:
+        positions[:, 1] = rng.random(len(positions), numpy.float32)
+
+    # two triangles per grid quad
+    quads = (numpy.arange(rows)[:, None] * (cols + 1)
+             + numpy.arange(cols)[None, :]).ravel()
+    faces = numpy.empty((len(quads), 2, 3), numpy.int64)
+    faces[:, 0] = numpy.stack((quads, quads + 1, quads + cols + 2), axis=1)
+    faces[:, 1] = numpy.stack((quads, quads + cols + 2, quads + cols + 1),
+                              axis=1)
+    faces = faces.reshape(-1, 3)[:num_tris]
+
+    uvs = numpy.stack((xs.ravel() / cols, ys.ravel() / rows), axis=1)
+
+    return positions, faces, uvs
+
+
+# ----------------------------------------------------------------------------
+def synth_chunks(tris=1000, width=0, textures=1, frames=0, commands=4,
+                 max_tris=SYNTH_MAX_TRIS, seed=0, mounts=0, compress=False):
+    """Build list of packed chunks of synthetic model"""
+    rng = numpy.random.default_rng(seed)
+    names = ["synth%03d" % i for i in range(max(1, -(-tris // max_tris)))]
+    tex_names = [("tex%03d" % i, None) for i in range(textures)]
+
+    # actor configuration referencing all geometries, padded with comments
+    lines = ["SetAuthor \"synth_cpj\""]
+    for name in names:
+        lines.append("SetGeometry \"%s\"" % name)
+        lines.append("SetSurface 0 \"%s\"" % name)
+        if frames:
+            lines.append("AddFrames \"%s\"" % name)
+    lines.extend("SetComment \"synthetic command %d\"" % i
+                 for i in range(len(lines), commands))
+    chunks = [cpj.encode_mac(names[0], [("autoexec", lines)])]
+
+    for i, name in enumerate(names):
+        num_tris = min(max_tris, tris - i * max_tris)
+        positions, faces, uvs = grid(num_tris, width, rng)
+
+        # mounts at random positions of random triangles
+        barys = rng.dirichlet((1.0, 1.0, 1.0), mounts)
+        chunks.append(cpj.encode_geo(name, positions, faces, mounts=[
+            ("mount%03d" % m, rng.integers(len(faces)), barys[m],
+             (1.0, 1.0, 1.0), (0.0, 0.0, 0.0, 1.0), (0.0, 0.0, 0.0))
+            for m in range(mounts)]))
+        chunks.append(cpj.encode_srf(
+            name, tex_names or [("default", None)], faces,
+            numpy.arange(len(faces)) % max(1, textures), uvs))
+
+        if frames:
+            wave = numpy.sin(positions[:, 0] * 0.1 + positions[:, 2] * 0.1)
+            chunks.append(cpj.encode_frm(name, [
+                ("frame%03d" % f, positions + numpy.outer(
+                    wave * math.sin(f * 2 * math.pi / frames), (0, 1, 0)))
+                for f in range(frames)], compress=compress))
+
+    return chunks
+
+
+# ----------------------------------------------------------------------------
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Generate valid synthetic Cannibal Project (CPJ) files")
+    parser.add_argument("output", help="CPJ file to write")
+    parser.add_argument("--tris", type=int, default=1000,
+                        help="total number of triangles")
+    parser.add_argument("--width", type=int, default=0,
+                        help="grid columns, sets vertex to triangle ratio "
+                             "(default square grid)")
+    parser.add_argument("--textures", type=int, default=1,
+                        help="number of surface textures")
+    parser.add_argument("--frames", type=int, default=0,
+                        help="number of vertex frames per geometry")
+    parser.add_argument("--commands", type=int, default=4,
+                        help="number of MAC commands, never less than "
+                             "needed to reference all chunks")
+    parser.add_argument("--max-tris", type=int, default=SYNTH_MAX_TRIS,
+                        help="triangles per geometry chunk")
+    parser.add_argument("--seed", type=int, default=0,
+                        help="random seed of vertex positions")
+    parser.add_argument("--mounts", type=int, default=0,
+                        help="number of mount points per geometry")
+    parser.add_argument("--compress", action="store_true",
+                        help="byte-compress vertex frames")
+    args = parser.parse_args(argv)
+
+    try:
+        chunks = synth_chunks(args.tris, args.width, args.textures,
+                              args.frames, args.commands, args.max_tris,
+                              args.seed, args.mounts, args.compress)
+    except ValueError as e:
+        print("%s: %s" % (args.output, e))
+        return 1
+
+    cpj.write_file(args.output, chunks)
+    print("%s: %d bytes, %d chunks" % (
+        args.output, os.path.getsize(args.output), len(chunks)))
+
+    return 0
+
+
+# ----------------------------------------------------------------------------
+if __name__ == "__main__":
+    sys.exit(main())
+
+
+# EoF
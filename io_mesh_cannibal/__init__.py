@@ -19,12 +19,15 @@
 # <pep8 compliant>
 
 # ----------------------------------------------------------------------------
+import os
 import importlib
 import bpy
 
 from bpy.props import (
     BoolProperty,
+    CollectionProperty,
     FloatProperty,
+    IntProperty,
     StringProperty,
     EnumProperty,
 )
@@ -63,6 +66,113 @@ class ImportCPJ(bpy.types.Operator, ImportHelper):
     filename_ext = ".cpj"
     filter_glob: StringProperty(default="*.cpj", options={'HIDDEN'})
 
+    use_mmap: BoolProperty(
+        name="Memory Map File",
+        description="Map file into memory and decode only chunks that are "
+                    "imported instead of reading the whole file",
+        default=True,
+    )
+    use_cache: BoolProperty(
+        name="Use Cache",
+        description="Keep decoded arrays in on-disk cache and reuse them "
+                    "when the same file is imported again",
+        default=False,
+    )
+    cache_dir: StringProperty(
+        name="Cache Directory",
+        description="Directory of decoded file cache, empty for default",
+        subtype='DIR_PATH',
+        default="",
+    )
+    cache_size: IntProperty(
+        name="Cache Size (MB)",
+        description="Least recently used entries are removed when cache "
+                    "grows over this size",
+        default=1024,
+        min=1,
+    )
+    frames_mode: EnumProperty(
+        name="Vertex Frames",
+        description="How vertex animation frames (FRM) are imported",
+        items=(
+            ('NONE', "None", "Do not import vertex frames"),
+            ('SHAPE_KEYS', "Shape Keys", "Import every frame as shape key"),
+            ('STREAM', "Stream",
+             "Keep frames in file and decode only the current frame "
+             "on frame change"),
+        ),
+        default='SHAPE_KEYS',
+    )
+    stream_cache: IntProperty(
+        name="Frame Cache",
+        description="Number of decoded frames kept in memory when "
+                    "streaming frames",
+        default=64,
+        min=1,
+    )
+    stream_prefetch: IntProperty(
+        name="Prefetch Frames",
+        description="Number of following frames decoded in background "
+                    "when streaming frames",
+        default=4,
+        min=0,
+    )
+    import_lod: BoolProperty(
+        name="Import LOD",
+        description="Import levels of detail (LOD) as separate meshes",
+        default=True,
+    )
+    lod_levels: StringProperty(
+        name="LOD Levels",
+        description="Comma separated indices of LOD levels to import, "
+                    "empty for all",
+        default="",
+    )
+    import_mounts: BoolProperty(
+        name="Import Mounts",
+        description="Create empties at geometry mount points, parented "
+                    "to the mesh",
+        default=True,
+    )
+    use_actor: BoolProperty(
+        name="Use Actor Configuration",
+        description="Import only chunks used by the model actor "
+                    "configuration (MAC), including chunks of other files "
+                    "it refers to",
+        default=True,
+    )
+    smooth_mode: EnumProperty(
+        name="Smoothing Groups",
+        description="How triangle smoothing groups (SRF) are imported",
+        items=(
+            ('NONE', "None", "Flat shading"),
+            ('SHARP_EDGES', "Sharp Edges",
+             "Smooth shading with sharp edges between groups"),
+            ('SPLIT_NORMALS', "Split Normals",
+             "Custom split normals averaged within groups, ignoring "
+             "triangles flagged so"),
+        ),
+        default='SHARP_EDGES',
+    )
+    use_dedup: BoolProperty(
+        name="Reuse Meshes",
+        description="Link mesh of earlier import when geometry, surface "
+                    "and vertex frames chunks are identical",
+        default=False,
+    )
+    texture_dir: StringProperty(
+        name="Texture Directory",
+        description="Directory searched for images named like CPJ "
+                    "textures, empty to not load images",
+        subtype='DIR_PATH',
+        default="",
+    )
+    use_profile: BoolProperty(
+        name="Profile",
+        description="Profile import with cProfile and log the slowest calls",
+        default=False,
+    )
+
     def execute(self, context):
         from . import import_cpj
         keywords = self.as_keywords(ignore=(
@@ -70,7 +180,288 @@ class ImportCPJ(bpy.types.Operator, ImportHelper):
             "axis_up",
             "filter_glob",
         ))
-        return import_cpj.load(context, **keywords)
+        stats = import_cpj.load(context, **keywords)
+        self.report({'INFO'}, stats.summary())
+
+        return {'FINISHED'}
+
+
+# ----------------------------------------------------------------------------
+class ImportCPJModal(ImportCPJ):
+    """Load a Cannibal Project (CPJ) File in background, keeping UI usable"""
+    bl_idname = "import_model.cpj_modal"
+    bl_label = "Import CPJ (Background)"
+    bl_options = {'UNDO'}
+
+    def execute(self, context):
+        from . import import_cpj
+
+        # without window there is no event loop to drive modal import
+        if context.window is None:
+            return super().execute(context)
+
+        keywords = self.as_keywords(ignore=(
+            "axis_forward",
+            "axis_up",
+            "filter_glob",
+        ))
+        self._job = import_cpj.CpjImportJob(**keywords)
+
+        wm = context.window_manager
+        self._timer = wm.event_timer_add(0.05, window=context.window)
+        wm.progress_begin(0, 100)
+        wm.modal_handler_add(self)
+
+        return {'RUNNING_MODAL'}
+
+    def modal(self, context, event):
+        from . import cpj
+
+        if event.type == 'ESC':
+            self.abort(context)
+            self.report({'WARNING'}, "Import cancelled")
+            return {'CANCELLED'}
+
+        if event.type != 'TIMER':
+            return {'PASS_THROUGH'}
+
+        # partial import is removed on any error, unexpected ones are raised
+        try:
+            done = self._job.step()
+        except (OSError, ImportError) + cpj.CPJ_DECODE_ERRORS as e:
+            self.abort(context)
+            self.report({'ERROR'}, str(e))
+            return {'CANCELLED'}
+        except Exception:
+            self.abort(context)
+            raise
+
+        if done:
+            self.end(context)
+            self.report({'INFO'}, self._job.stats.summary())
+            return {'FINISHED'}
+
+        progress = int(self._job.progress * 100)
+        context.window_manager.progress_update(progress)
+        context.workspace.status_text_set(
+            "Importing %s: %d%% (Esc to cancel)" % (
+                os.path.basename(self.filepath), progress))
+
+        return {'PASS_THROUGH'}
+
+    def abort(self, context):
+        try:
+            self._job.cancel()
+        finally:
+            self.end(context)
+
+    def end(self, context):
+        wm = context.window_manager
+        wm.event_timer_remove(self._timer)
+        wm.progress_end()
+        context.workspace.status_text_set(None)
+
+
+# ----------------------------------------------------------------------------
+class ImportCPJBatch(bpy.types.Operator):
+    """Load many Cannibal Project (CPJ) Files, decoding them in parallel"""
+    bl_idname = "import_model.cpj_batch"
+    bl_label = "Import CPJ Batch"
+    bl_options = {'UNDO'}
+
+    directory: StringProperty(subtype='DIR_PATH')
+    files: CollectionProperty(type=bpy.types.OperatorFileListElement)
+    filter_glob: StringProperty(default="*.cpj", options={'HIDDEN'})
+
+    pattern: StringProperty(
+        name="Pattern",
+        description="Glob pattern of files to import from directory "
+                    "when no files are selected",
+        default="*.cpj",
+    )
+    recursive: BoolProperty(
+        name="Recursive",
+        description="Search subdirectories for files matching pattern",
+        default=False,
+    )
+    use_mmap: BoolProperty(
+        name="Memory Map File",
+        description="Map file into memory and decode only chunks that are "
+                    "imported instead of reading the whole file",
+        default=True,
+    )
+    max_workers: IntProperty(
+        name="Workers",
+        description="Number of worker processes decoding files, "
+                    "0 for one per CPU",
+        default=0,
+        min=0,
+    )
+    use_cache: BoolProperty(
+        name="Use Cache",
+        description="Keep decoded arrays in on-disk cache and reuse them "
+                    "when the same file is imported again",
+        default=False,
+    )
+    cache_dir: StringProperty(
+        name="Cache Directory",
+        description="Directory of decoded file cache, empty for default",
+        subtype='DIR_PATH',
+        default="",
+    )
+    cache_size: IntProperty(
+        name="Cache Size (MB)",
+        description="Least recently used entries are removed when cache "
+                    "grows over this size",
+        default=1024,
+        min=1,
+    )
+    frames_mode: EnumProperty(
+        name="Vertex Frames",
+        description="How vertex animation frames (FRM) are imported",
+        items=(
+            ('NONE', "None", "Do not import vertex frames"),
+            ('SHAPE_KEYS', "Shape Keys", "Import every frame as shape key"),
+            ('STREAM', "Stream",
+             "Keep frames in file and decode only the current frame "
+             "on frame change"),
+        ),
+        default='SHAPE_KEYS',
+    )
+    stream_cache: IntProperty(
+        name="Frame Cache",
+        description="Number of decoded frames kept in memory when "
+                    "streaming frames",
+        default=64,
+        min=1,
+    )
+    stream_prefetch: IntProperty(
+        name="Prefetch Frames",
+        description="Number of following frames decoded in background "
+                    "when streaming frames",
+        default=4,
+        min=0,
+    )
+    import_lod: BoolProperty(
+        name="Import LOD",
+        description="Import levels of detail (LOD) as separate meshes",
+        default=True,
+    )
+    lod_levels: StringProperty(
+        name="LOD Levels",
+        description="Comma separated indices of LOD levels to import, "
+                    "empty for all",
+        default="",
+    )
+    import_mounts: BoolProperty(
+        name="Import Mounts",
+        description="Create empties at geometry mount points, parented "
+                    "to the mesh",
+        default=True,
+    )
+    use_actor: BoolProperty(
+        name="Use Actor Configuration",
+        description="Import only chunks used by the model actor "
+                    "configuration (MAC), including chunks of other files "
+                    "it refers to",
+        default=True,
+    )
+    smooth_mode: EnumProperty(
+        name="Smoothing Groups",
+        description="How triangle smoothing groups (SRF) are imported",
+        items=(
+            ('NONE', "None", "Flat shading"),
+            ('SHARP_EDGES', "Sharp Edges",
+             "Smooth shading with sharp edges between groups"),
+            ('SPLIT_NORMALS', "Split Normals",
+             "Custom split normals averaged within groups, ignoring "
+             "triangles flagged so"),
+        ),
+        default='SHARP_EDGES',
+    )
+    use_dedup: BoolProperty(
+        name="Reuse Meshes",
+        description="Link mesh of earlier import when geometry, surface "
+                    "and vertex frames chunks are identical",
+        default=False,
+    )
+    texture_dir: StringProperty(
+        name="Texture Directory",
+        description="Directory searched for images named like CPJ "
+                    "textures, empty to not load images",
+        subtype='DIR_PATH',
+        default="",
+    )
+    use_profile: BoolProperty(
+        name="Profile",
+        description="Profile import with cProfile and log the slowest calls",
+        default=False,
+    )
+
+    def invoke(self, context, event):
+        context.window_manager.fileselect_add(self)
+        return {'RUNNING_MODAL'}
+
+    def execute(self, context):
+        from . import cpj, import_cpj
+
+        filepaths = [os.path.join(self.directory, f.name)
+                     for f in self.files if f.name]
+        if not filepaths:
+            filepaths = cpj.find_files([self.directory], self.pattern,
+                                       self.recursive)
+        if not filepaths:
+            self.report({'WARNING'}, "No CPJ files found")
+            return {'CANCELLED'}
+
+        keywords = self.as_keywords(ignore=(
+            "directory",
+            "files",
+            "filter_glob",
+            "pattern",
+            "recursive",
+        ))
+        failed = import_cpj.load_batch(context, filepaths, **keywords)
+        for filepath, error in failed:
+            self.report({'WARNING'}, "%s: %s" % (filepath, error))
+
+        return {'FINISHED'}
+
+
+# ----------------------------------------------------------------------------
+class RefreshCPJ(bpy.types.Operator):
+    """Update selected CPJ objects from chunks changed since import"""
+    bl_idname = "import_model.cpj_refresh"
+    bl_label = "Refresh CPJ"
+    bl_options = {'REGISTER', 'UNDO'}
+
+    use_mmap: BoolProperty(
+        name="Memory Map File",
+        description="Map file into memory and decode only chunks that are "
+                    "imported instead of reading the whole file",
+        default=True,
+    )
+
+    @classmethod
+    def poll(cls, context):
+        return any("cpj_chunks" in obj for obj in context.selected_objects)
+
+    def execute(self, context):
+        from . import cpj, refresh_cpj
+
+        refreshed = 0
+        for obj in context.selected_objects:
+            if obj.type != 'MESH' or "cpj_chunks" not in obj:
+                continue
+            try:
+                refreshed += len(refresh_cpj.refresh(context, obj,
+                                                     self.use_mmap))
+            except (OSError, ImportError) + cpj.CPJ_DECODE_ERRORS as e:
+                self.report({'WARNING'}, "%s: %s" % (obj.name, e))
+
+        self.report({'INFO'}, "%d chunks refreshed" % refreshed)
+
+        return {'FINISHED'}
 
 
 # ----------------------------------------------------------------------------
@@ -83,6 +474,12 @@ class ExportCPJ(bpy.types.Operator, ExportHelper):
     filename_ext = ".cpj"
     filter_glob: StringProperty(default="*.cpj", options={'HIDDEN'})
 
+    use_mesh_modifiers: BoolProperty(
+        name="Apply Modifiers",
+        description="Export mesh with modifiers applied",
+        default=True,
+    )
+
     def execute(self, context):
         from . import export_cpj
         keywords = self.as_keywords(ignore=(
@@ -91,12 +488,22 @@ class ExportCPJ(bpy.types.Operator, ExportHelper):
             "check_existing",
             "filter_glob",
         ))
-        return export_cpj.save(context, **keywords)
+        try:
+            return export_cpj.save(context, **keywords)
+        except (OSError, ValueError) as e:
+            self.report({'ERROR'}, str(e))
+            return {'CANCELLED'}
 
 
 # ----------------------------------------------------------------------------
 def menu_func_import(self, context):
     self.layout.operator(ImportCPJ.bl_idname, text="Cannibal Project (.cpj)")
+    self.layout.operator(ImportCPJModal.bl_idname,
+                         text="Cannibal Project Background (.cpj)")
+    self.layout.operator(ImportCPJBatch.bl_idname,
+                         text="Cannibal Project Batch (.cpj)")
+    self.layout.operator(RefreshCPJ.bl_idname,
+                         text="Cannibal Project Refresh (.cpj)")
 
 
 # ----------------------------------------------------------------------------
@@ -107,6 +514,9 @@ def menu_func_export(self, context):
 # ----------------------------------------------------------------------------
 classes = {
     ImportCPJ,
+    ImportCPJModal,
+    ImportCPJBatch,
+    RefreshCPJ,
     ExportCPJ,
 }
 
@@ -119,19 +529,23 @@ def register():
     bpy.types.TOPBAR_MT_file_import.append(menu_func_import)
     bpy.types.TOPBAR_MT_file_export.append(menu_func_export)
 
-    print("CPJ plugin loaded")  # FIXME debug
+    from . import registry, stream_frm
+    registry.register()
+    stream_frm.register()
 
 
 # ----------------------------------------------------------------------------
 def unregister():
+    from . import registry, stream_frm
+    stream_frm.unregister()
+    registry.unregister()
+
     bpy.types.TOPBAR_MT_file_import.remove(menu_func_import)
     bpy.types.TOPBAR_MT_file_export.remove(menu_func_export)
 
     for cls in classes:
         bpy.utils.unregister_class(cls)
 
-    print("CPJ plugin unloaded")  # FIXME debug
-
 
 # ----------------------------------------------------------------------------
 if "import_cpj" in locals():
@@ -140,6 +554,15 @@ if "import_cpj" in locals():
 if "export_cpj" in locals():
     importlib.reload(export_cpj)
 
+if "stream_frm" in locals():
+    importlib.reload(stream_frm)
+
+if "refresh_cpj" in locals():
+    importlib.reload(refresh_cpj)
+
+if "registry" in locals():
+    importlib.reload(registry)
+
 if __name__ == "__main__":
     register()
 
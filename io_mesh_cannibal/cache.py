@@ -0,0 +1,233 @@
+# ##### BEGIN GPL LICENSE BLOCK #####
+#
+#  This program is free software; you can redistribute it and/or
+#  modify it under the terms of the GNU General Public License
+#  as published by the Free Software Foundation; either version 2
+#  of the License, or (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with this program; if not, write to the Free Software Foundation,
+#  Inc., 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301, USA.
+#
+# ##### END GPL LICENSE BLOCK #####
+
+# <pep8 compliant>
+
+# ----------------------------------------------------------------------------
+import os
+import json
+import hashlib
+import tempfile
+import numpy
+
+from .cpj import (
+    CPJ_DECODERS,
+    CPJ_PARSER_VERSION,
+    CpjChunk,
+    CpjLodLevel,
+    CpjModel,
+    decode_file,
+)
+
+# objects stored in lists of decoded chunks
+CACHE_TYPES = {cls.__name__: cls for cls in (CpjLodLevel,)}
+
+
+# ----------------------------------------------------------------------------
+def default_cache_dir():
+    if os.name == "nt":
+        base = os.environ.get("LOCALAPPDATA") or os.path.expanduser("~")
+    else:
+        base = (os.environ.get("XDG_CACHE_HOME")
+                or os.path.join(os.path.expanduser("~"), ".cache"))
+    return os.path.join(base, "io_mesh_cannibal")
+
+
+# ----------------------------------------------------------------------------
+class CpjCache:
+    """On-disk cache of decoded CPJ models keyed by file content
+
+    Every entry is a single .npz file holding decoded arrays plus JSON
+    metadata. Entries are evicted least recently used first once total
+    size of cache exceeds max_size bytes.
+    """
+
+    def __init__(self, directory="", max_size=1024 * 1024 * 1024):
+        self.directory = directory or default_cache_dir()
+        self.max_size = max_size
+
+    def key(self, filepath, magics=None):
+        digest = hashlib.sha1()
+        with open(filepath, mode="rb") as handle:
+            for block in iter(lambda: handle.read(1024 * 1024), b""):
+                digest.update(block)
+
+        digest.update(b"%d" % CPJ_PARSER_VERSION)
+        if magics is not None:
+            digest.update("".join(sorted(magics)).encode())
+
+        return digest.hexdigest()
+
+    def path(self, key):
+        return os.path.join(self.directory, key + ".npz")
+
+    def load(self, filepath, magics=None, use_mmap=True):
+        """Return CpjModel from cache, decoding and storing it on miss"""
+        key = self.key(filepath, magics)
+
+        model = self.get(key, filepath)
+        if model is None:
+            model = decode_file(filepath, magics, use_mmap)
+            self.put(key, model)
+
+        return model
+
+    def get(self, key, filepath):
+        path = self.path(key)
+        try:
+            with numpy.load(path, allow_pickle=False) as entry:
+                arrays = {name: entry[name] for name in entry.files}
+        except (OSError, ValueError):
+            return None
+
+        # mark as recently used
+        try:
+            os.utime(path)
+        except OSError:
+            pass
+
+        return model_from_arrays(filepath, arrays)
+
+    def put(self, key, model):
+        os.makedirs(self.directory, exist_ok=True)
+
+        # write to temporary file first, concurrent readers never see
+        # partially written entries
+        fd, tmp = tempfile.mkstemp(suffix=".tmp", dir=self.directory)
+        try:
+            with os.fdopen(fd, mode="wb") as handle:
+                numpy.savez(handle, **model_to_arrays(model))
+            os.replace(tmp, self.path(key))
+        except Exception:
+            os.remove(tmp)
+            raise
+
+        self.evict()
+
+    def evict(self):
+        entries = []
+        total = 0
+        for entry in os.scandir(self.directory):
+            if entry.name.endswith(".npz"):
+                try:
+                    stat = entry.stat()
+                except OSError:
+                    continue
+                entries.append((stat.st_mtime, stat.st_size, entry.path))
+                total += stat.st_size
+
+        # least recently used first
+        entries.sort()
+        for mtime, size, path in entries:
+            if total <= self.max_size:
+                break
+            try:
+                os.remove(path)
+            except OSError:
+                pass  # removed by other process
+            total -= size
+
+    def clear(self):
+        if os.path.isdir(self.directory):
+            for entry in os.scandir(self.directory):
+                if entry.name.endswith(".npz"):
+                    os.remove(entry.path)
+
+
+# ----------------------------------------------------------------------------
+def model_to_arrays(model):
+    arrays = {}
+    meta = {
+        "chunks": [[chunk.magic, chunk.version, chunk.timestamp,
+                    chunk.offset, chunk.length, chunk.name]
+                   for chunk in model.chunks],
+        "decoded": {},
+    }
+
+    for i, (offset, value) in enumerate(model.decoded.items()):
+        meta["decoded"][offset] = value_to_arrays(value, str(i), arrays)
+
+    arrays["meta"] = numpy.frombuffer(json.dumps(meta).encode(), numpy.uint8)
+    return arrays
+
+
+# ----------------------------------------------------------------------------
+def value_to_arrays(value, prefix, arrays):
+    """Split attributes of decoded object into arrays and JSON metadata
+
+    Lists of objects like LOD levels are stored attribute by attribute,
+    other types JSON can't store are rejected.
+    """
+    attrs = {}
+    for attr, item in vars(value).items():
+        name = "%s.%s" % (prefix, attr)
+        if isinstance(item, (bytes, memoryview)):
+            item = numpy.frombuffer(item, numpy.uint8)
+
+        if isinstance(item, numpy.ndarray):
+            arrays[name] = item
+            attrs[attr] = {"array": name}
+
+        elif (isinstance(item, list) and item
+              and all(hasattr(obj, "__dict__") for obj in item)):
+            kind = type(item[0]).__name__
+            if CACHE_TYPES.get(kind) is not type(item[0]):
+                raise TypeError("Cannot cache %s of %s" % (attr, kind))
+            attrs[attr] = {"type": kind, "items": [
+                value_to_arrays(obj, "%s.%d" % (name, j), arrays)
+                for j, obj in enumerate(item)]}
+
+        else:
+            attrs[attr] = {"value": item}
+
+    return attrs
+
+
+# ----------------------------------------------------------------------------
+def value_from_arrays(cls, attrs, arrays):
+    """Rebuild decoded object without running its decoder"""
+    value = cls.__new__(cls)
+    for attr, item in attrs.items():
+        if "array" in item:
+            setattr(value, attr, arrays[item["array"]])
+        elif "items" in item:
+            setattr(value, attr, [
+                value_from_arrays(CACHE_TYPES[item["type"]], obj, arrays)
+                for obj in item["items"]])
+        else:
+            setattr(value, attr, item["value"])
+    return value
+
+
+# ----------------------------------------------------------------------------
+def model_from_arrays(filepath, arrays):
+    meta = json.loads(arrays["meta"].tobytes())
+
+    chunks = [CpjChunk(*args) for args in meta["chunks"]]
+    magics = {chunk.offset: chunk.magic for chunk in chunks}
+
+    decoded = {}
+    for offset, attrs in meta["decoded"].items():
+        offset = int(offset)
+        decoded[offset] = value_from_arrays(CPJ_DECODERS[magics[offset]],
+                                            attrs, arrays)
+
+    return CpjModel(filepath, chunks, decoded)
+
+
+# EoF
@@ -0,0 +1,1641 @@
+# ##### BEGIN GPL LICENSE BLOCK #####
+#
+#  This program is free software; you can redistribute it and/or
+#  modify it under the terms of the GNU General Public License
+#  as published by the Free Software Foundation; either version 2
+#  of the License, or (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with this program; if not, write to the Free Software Foundation,
+#  Inc., 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301, USA.
+#
+# ##### END GPL LICENSE BLOCK #####
+
+# <pep8 compliant>
+
+# ----------------------------------------------------------------------------
+import os
+import sys
+import glob
+import shlex
+import struct
+import mmap
+import concurrent.futures
+import numpy
+
+
+# ----------------------------------------------------------------------------
+CPJ_HDR_RIFF_MAGIC = struct.unpack("I", b"RIFF")[0]
+CPJ_HDR_FORM_MAGIC = struct.unpack("I", b"CPJB")[0]
+
+CPJ_FRM_MAGIC = "FRMB"
+CPJ_FRM_VERSION = 1
+CPJ_GEO_MAGIC = "GEOB"
+CPJ_GEO_VERSION = 1
+CPJ_LOD_MAGIC = "LODB"
+CPJ_LOD_VERSION = 3
+CPJ_MAC_MAGIC = "MACB"
+CPJ_MAC_VERSION = 1
+CPJ_SEQ_MAGIC = "SEQB"
+CPJ_SEQ_VERSION = 1
+CPJ_SKL_MAGIC = "SKLB"
+CPJ_SKL_VERSION = 1
+CPJ_SRF_MAGIC = "SRFB"
+CPJ_SRF_VERSION = 1
+
+# version of decoded data layout, bump when decoders change
+CPJ_PARSER_VERSION = 3
+
+# unsigned char flags; // GEOVF_ vertex flags
+# unsigned char groupIndex; // group index for vertex frame compression
+# unsigned short reserved; // reserved for future use, must be zero
+# unsigned short numEdgeLinks; // number of edges linked to this vertex
+# unsigned short numTriLinks; // number of triangles linked to this vertex
+# unsigned long firstEdgeLink; // first edge index in object link array
+# unsigned long firstTriLink; // first triangle index in object link array
+# CPJVECTOR refPosition; // reference position of vertex
+SGeoVert = numpy.dtype([
+    ("flags", "u1"),
+    ("groupIndex", "u1"),
+    ("reserved", "<u2"),
+    ("numEdgeLinks", "<u2"),
+    ("numTriLinks", "<u2"),
+    ("firstEdgeLink", "<u4"),
+    ("firstTriLink", "<u4"),
+    ("refPosition", "<f4", 3),
+])
+
+# unsigned short headVertex; // vertex list index of edge's head vertex
+# unsigned short tailVertex; // vertex list index of edge's tail vertex
+# unsigned short invertedEdge; // edge list index of inverted mirror edge
+# unsigned short numTriLinks; // number of triangles linked to this edge
+# unsigned long firstTriLink; // first triangle index in object link array
+SGeoEdge = numpy.dtype([
+    ("headVertex", "<u2"),
+    ("tailVertex", "<u2"),
+    ("invertedEdge", "<u2"),
+    ("numTriLinks", "<u2"),
+    ("firstTriLink", "<u4"),
+])
+
+# unsigned short edgeRing[3]; // edge list indices used by triangle, whose
+#                             // tail vertices are V0, V1, and V2, in order
+# unsigned short reserved; // reserved for future use, must be zero
+SGeoTri = numpy.dtype([
+    ("edgeRing", "<u2", 3),
+    ("reserved", "<u2"),
+])
+
+# unsigned long ofsName; // offset of mount name string in data block
+# unsigned long triIndex; // mesh triangle index mount is attached to
+# CPJVECTOR triBarys; // barycentric coordinates of mount origin
+# CPJVECTOR baseScale; // base transform scaling
+# CPJQUAT baseRotate; // base transform rotation quaternion
+# CPJVECTOR baseTranslate; // base transform translation
+SGeoMount = numpy.dtype([
+    ("ofsName", "<u4"),
+    ("triIndex", "<u4"),
+    ("triBarys", "<f4", 3),
+    ("baseScale", "<f4", 3),
+    ("baseRotate", "<f4", 4),
+    ("baseTranslate", "<f4", 3),
+])
+
+# unsigned short uvIndex[3]; // UV texture coordinate indices used
+# unsigned char texIndex; // surface texture index
+# unsigned char reserved; // reserved for future use, must be zero
+# unsigned long flags; // SRFTF_ triangle flags
+# unsigned char smoothGroup; // light smoothing group
+# unsigned char alphaLevel; // transparent/modulated alpha level
+# unsigned char glazeTexIndex; // second-pass glaze texture index if used
+# unsigned char glazeFunc; // ESrfGlaze second-pass glaze function
+SSrfTri = numpy.dtype([
+    ("uvIndex", "<u2", 3),
+    ("texIndex", "u1"),
+    ("reserved", "u1"),
+    ("flags", "<u4"),
+    ("smoothGroup", "u1"),
+    ("alphaLevel", "u1"),
+    ("glazeTexIndex", "u1"),
+    ("glazeFunc", "u1"),
+])
+
+# SSrfTri flags
+SRFTF_INACTIVE = 0x00000001  # triangle is not active
+SRFTF_HIDDEN = 0x00000002  # present but invisible
+SRFTF_VNIGNORE = 0x00000004  # ignored in vertex normal calculations
+SRFTF_TRANSPARENT = 0x00000008  # transparent rendering is enabled
+SRFTF_UNLIT = 0x00000020  # not affected by dynamic lighting
+SRFTF_TWOSIDED = 0x00000040  # visible from both sides
+SRFTF_MASKING = 0x00000080  # color key masking is active
+SRFTF_MODULATED = 0x00000100  # modulated rendering is enabled
+SRFTF_ENVMAP = 0x00000200  # environment mapped
+SRFTF_NONCOLLIDE = 0x00000400  # traceray won't collide with this surface
+SRFTF_TEXBLEND = 0x00000800
+SRFTF_ZLATER = 0x00001000
+SRFTF_RESERVED = 0x00010000
+
+# float u; // texture U coordinate
+# float v; // texture V coordinate
+SSrfUV = numpy.dtype([
+    ("u", "<f4"),
+    ("v", "<f4"),
+])
+
+# unsigned long srfTriIndex; // SRF triangle index
+# unsigned short vertIndex[3]; // relevant vertex indices
+# unsigned short uvIndex[3]; // relevant UV indices
+SLodTri = numpy.dtype([
+    ("srfTriIndex", "<u4"),
+    ("vertIndex", "<u2", 3),
+    ("uvIndex", "<u2", 3),
+])
+
+# unsigned long ofsName; // offset of bone name string in data block
+# unsigned long parentIndex; // parent bone index, -1 if none
+# CPJVECTOR baseScale; // base transform scaling
+# CPJQUAT baseRotate; // base transform rotation quaternion
+# CPJVECTOR baseTranslate; // base transform translation
+# float length; // length of the bone
+SSklBone = numpy.dtype([
+    ("ofsName", "<u4"),
+    ("parentIndex", "<i4"),
+    ("baseScale", "<f4", 3),
+    ("baseRotate", "<f4", 4),
+    ("baseTranslate", "<f4", 3),
+    ("length", "<f4"),
+])
+
+# unsigned short numWeights; // number of bone weights
+# unsigned short firstWeight; // first bone weight index
+SSklVert = numpy.dtype([
+    ("numWeights", "<u2"),
+    ("firstWeight", "<u2"),
+])
+
+# unsigned short boneIndex; // bone index
+# unsigned short reserved; // reserved for future use, must be zero
+# float weightFactor; // weight factor
+# CPJVECTOR offsetPos; // offset position vector
+SSklWeight = numpy.dtype([
+    ("boneIndex", "<u2"),
+    ("reserved", "<u2"),
+    ("weightFactor", "<f4"),
+    ("offsetPos", "<f4", 3),
+])
+
+# unsigned long ofsName; // offset of mount name string in data block
+# unsigned long boneIndex; // bone index of mount base, -1 if none
+# CPJVECTOR baseScale; // base transform scaling
+# CPJQUAT baseRotate; // base transform rotation quaternion
+# CPJVECTOR baseTranslate; // base transform translation
+SSklMount = numpy.dtype([
+    ("ofsName", "<u4"),
+    ("boneIndex", "<i4"),
+    ("baseScale", "<f4", 3),
+    ("baseRotate", "<f4", 4),
+    ("baseTranslate", "<f4", 3),
+])
+
+# unsigned long ofsFrameName; // offset of frame name in data block
+# unsigned long numGroups; // number of compression groups, zero if uncompressed
+# unsigned long ofsGroups; // offset of compression groups in data block
+# unsigned long numVerts; // number of vertices
+# unsigned long ofsVerts; // offset of vertices in data block
+SFrmFrame = numpy.dtype([
+    ("ofsFrameName", "<u4"),
+    ("numGroups", "<u4"),
+    ("ofsGroups", "<u4"),
+    ("numVerts", "<u4"),
+    ("ofsVerts", "<u4"),
+])
+
+# CPJVECTOR byteScale; // scale for byte-compressed position
+# CPJVECTOR byteTranslate; // translation for byte-compressed position
+SFrmGroup = numpy.dtype([
+    ("byteScale", "<f4", 3),
+    ("byteTranslate", "<f4", 3),
+])
+
+# unsigned char group; // compression group index
+# unsigned char pos[3]; // byte-compressed position
+SFrmBytePos = numpy.dtype([
+    ("group", "u1"),
+    ("pos", "u1", 3),
+])
+
+# unsigned char reserved; // reserved for future use, must be zero
+# unsigned char numBoneTranslate; // number of bone translations
+# unsigned char numBoneRotate; // number of bone rotations
+# unsigned char numBoneScale; // number of bone scales
+# unsigned long firstBoneTranslate; // first bone translation index
+# unsigned long firstBoneRotate; // first bone rotation index
+# unsigned long firstBoneScale; // first bone scale index
+# unsigned long ofsVertFrameName; // offset of vertex frame name, -1 if none
+SSeqFrame = numpy.dtype([
+    ("reserved", "u1"),
+    ("numBoneTranslate", "u1"),
+    ("numBoneRotate", "u1"),
+    ("numBoneScale", "u1"),
+    ("firstBoneTranslate", "<u4"),
+    ("firstBoneRotate", "<u4"),
+    ("firstBoneScale", "<u4"),
+    ("ofsVertFrameName", "<u4"),
+])
+
+# unsigned long eventType; // FOURCC of event
+# float time; // sequence time of event (0.0 to 1.0)
+# unsigned long ofsParam; // offset of parameter string, -1 if none
+SSeqEvent = numpy.dtype([
+    ("eventType", "<u4"),
+    ("time", "<f4"),
+    ("ofsParam", "<u4"),
+])
+
+# unsigned long ofsName; // offset of bone name string in data block
+# float srcLength; // source length of bone
+SSeqBoneInfo = numpy.dtype([
+    ("ofsName", "<u4"),
+    ("srcLength", "<f4"),
+])
+
+# unsigned short boneIndex; // bone info index
+# unsigned short reserved; // reserved for future use, must be zero
+# CPJVECTOR translate; // translation vector
+SSeqBoneTranslate = numpy.dtype([
+    ("boneIndex", "<u2"),
+    ("reserved", "<u2"),
+    ("translate", "<f4", 3),
+])
+
+# unsigned short boneIndex; // bone info index
+# signed short roll; // roll about Z axis in 64k degrees
+# signed short pitch; // pitch about X axis in 64k degrees
+# signed short yaw; // yaw about Y axis in 64k degrees
+SSeqBoneRotate = numpy.dtype([
+    ("boneIndex", "<u2"),
+    ("roll", "<i2"),
+    ("pitch", "<i2"),
+    ("yaw", "<i2"),
+])
+
+# unsigned short boneIndex; // bone info index
+# unsigned short reserved; // reserved for future use, must be zero
+# CPJVECTOR scale; // scale vector
+SSeqBoneScale = numpy.dtype([
+    ("boneIndex", "<u2"),
+    ("reserved", "<u2"),
+    ("scale", "<f4", 3),
+])
+
+CPJ_NO_OFFSET = 0xffffffff
+
+# errors raised by decoders on malformed chunk data
+CPJ_DECODE_ERRORS = (ValueError, IndexError, struct.error, UnicodeDecodeError)
+
+
+# ----------------------------------------------------------------------------
+CPJ_CHUNK_VERSIONS = {
+    CPJ_FRM_MAGIC: CPJ_FRM_VERSION,
+    CPJ_GEO_MAGIC: CPJ_GEO_VERSION,
+    CPJ_LOD_MAGIC: CPJ_LOD_VERSION,
+    CPJ_MAC_MAGIC: CPJ_MAC_VERSION,
+    CPJ_SEQ_MAGIC: CPJ_SEQ_VERSION,
+    CPJ_SKL_MAGIC: CPJ_SKL_VERSION,
+    CPJ_SRF_MAGIC: CPJ_SRF_VERSION,
+}
+
+
+# ----------------------------------------------------------------------------
+class CpjStringTable:
+    """Reader of NUL terminated strings stored in CPJ data"""
+
+    def __init__(self, data, cache=True):
+        self.data = data
+        self.view = memoryview(data)
+        self.cache = {} if cache else None
+
+    def read(self, ofs):
+        if self.cache is not None:
+            value = self.cache.get(ofs)
+            if value is not None:
+                return value
+
+        # decode only bytes up to terminator, never copy rest of the file
+        end = self.data.find(b"\0", ofs)
+        if end < 0:
+            end = len(self.data)
+        value = str(self.view[ofs:end], "utf-8")
+
+        if self.cache is not None:
+            self.cache[ofs] = value
+
+        return value
+
+    def close(self):
+        self.cache = {} if self.cache is not None else None
+        self.view.release()
+
+
+# ----------------------------------------------------------------------------
+class CpjChunk:
+    """Single entry of CPJ chunk directory"""
+
+    __slots__ = ("magic", "version", "timestamp", "offset", "length", "name")
+
+    def __init__(self, magic, version, timestamp, offset, length, name):
+        self.magic = magic
+        self.version = version
+        self.timestamp = timestamp
+        self.offset = offset  # offset of chunk header from start of file
+        self.length = length  # length of chunk following lenFile value
+        self.name = name
+
+    def __repr__(self):
+        return "<CpjChunk %s v%d '%s' @%d+%d>" % (
+            self.magic, self.version, self.name, self.offset, self.length)
+
+    @property
+    def supported(self):
+        return CPJ_CHUNK_VERSIONS.get(self.magic) == self.version
+
+
+# ----------------------------------------------------------------------------
+class CpjChunkList:
+    """Chunk lookups shared by chunk directories and decoded models"""
+
+    chunks = ()
+
+    def __iter__(self):
+        return iter(self.chunks)
+
+    def __len__(self):
+        return len(self.chunks)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def by_type(self, magic):
+        return [chunk for chunk in self.chunks if chunk.magic == magic]
+
+    def by_name(self, name, magic=None):
+        return [chunk for chunk in self.chunks
+                if chunk.name == name and (magic is None or chunk.magic == magic)]
+
+    def find(self, magic, name=None):
+        for chunk in self.chunks:
+            if chunk.magic == magic and (name is None or chunk.name == name):
+                return chunk
+        return None
+
+    def check_supported(self):
+        for chunk in self.chunks:
+            if not chunk.supported:
+                raise ImportError("Unsupported %s v%d chunk" %
+                                  (chunk.magic, chunk.version))
+
+    def source(self, chunk):
+        """Path of file containing chunk"""
+        return getattr(self, "filepath", "")
+
+    def close(self):
+        pass
+
+
+# ----------------------------------------------------------------------------
+class CpjDirectory(CpjChunkList):
+    """Directory of all chunks in CPJ data, built in a single pass
+
+    Only chunk headers are parsed up front, chunk payloads are decoded on
+    first access through decode() and kept until close().
+    """
+
+    def __init__(self, data):
+
+        if len(data) < 12:
+            raise ImportError("This file is not a CPJ file")
+
+        # unsigned long riffMagic; // CPJ_HDR_RIFF_MAGIC
+        # unsigned long lenFile; // length of file following this value
+        # unsigned long formMagic; // CPJ_HDR_FORM_MAGIC
+        SCpjFileHeader = struct.unpack_from("III", data, 0)
+
+        if (SCpjFileHeader[0] != CPJ_HDR_RIFF_MAGIC
+                or SCpjFileHeader[2] != CPJ_HDR_FORM_MAGIC):
+            raise ImportError("This file is not a CPJ file")
+
+        if SCpjFileHeader[1] != len(data) - 8:
+            raise ImportError("File has wrong size, propably corrupted")
+
+        self.data = data
+        self.strings = CpjStringTable(data)
+        self.chunks = []
+        self.decoded = {}
+
+        # skip file header
+        idx = 12
+
+        # loop over all chunks
+        while idx < len(data):
+
+            if idx + 20 > len(data):
+                raise ImportError("File has wrong size, propably corrupted")
+
+            # unsigned long magic; // chunk-specific magic marker
+            # unsigned long lenFile; // length of chunk following this value
+            # unsigned long version; // chunk-specific format version
+            # unsigned long timeStamp; // time stamp of chunk creation
+            # unsigned long ofsName; // offset of chunk name string from start of chunk
+            #                        // If this value is zero, the chunk is nameless
+            SCpjChunkHeader = struct.unpack_from("IIIII", data, idx)
+
+            # decode chunk type
+            magic = data[idx:idx + 4].decode()
+
+            if SCpjChunkHeader[4] > 0:
+                name = self.strings.read(idx + SCpjChunkHeader[4])
+            else:
+                name = "nameless"
+
+            self.chunks.append(CpjChunk(magic, SCpjChunkHeader[2],
+                                        SCpjChunkHeader[3], idx,
+                                        SCpjChunkHeader[1], name))
+
+            # seek to next chunk (16 bit aligned)
+            idx += SCpjChunkHeader[1] + (SCpjChunkHeader[1] % 2) + 8
+
+    def decode(self, chunk):
+        value = self.decoded.get(chunk.offset)
+        if value is None:
+            value = CPJ_DECODERS[chunk.magic](self, chunk)
+            self.decoded[chunk.offset] = value
+        return value
+
+    def close(self):
+        self.decoded.clear()
+        self.strings.close()
+
+
+# ----------------------------------------------------------------------------
+class CpjFile(CpjDirectory):
+    """Chunk directory of CPJ file on disk, memory mapped by default"""
+
+    def __init__(self, filepath, use_mmap=True):
+        with open(filepath, mode="rb") as handle:
+            if not use_mmap:
+                data = handle.read()
+            else:
+                try:
+                    data = mmap.mmap(handle.fileno(), 0,
+                                     access=mmap.ACCESS_READ)
+                except ValueError:
+                    data = b""  # empty files cannot be mapped
+
+        try:
+            super().__init__(data)
+        except Exception:
+            # string table view must be released before mapping is closed
+            if getattr(self, "strings", None) is not None:
+                self.strings.close()
+            if isinstance(data, mmap.mmap):
+                try:
+                    data.close()
+                except BufferError:
+                    pass  # unmapped on gc
+            raise
+
+        self.filepath = filepath
+
+    def close(self):
+        super().close()
+        if isinstance(self.data, mmap.mmap):
+            try:
+                self.data.close()
+            except BufferError:
+                pass  # arrays still refer to mapping, it is unmapped on gc
+
+
+# ----------------------------------------------------------------------------
+class CpjModel(CpjChunkList):
+    """Chunk directory with payloads already decoded, detached from file
+
+    Models can be pickled, so they are used to pass decoded files from
+    worker processes back to Blender.
+    """
+
+    def __init__(self, filepath, chunks, decoded):
+        self.filepath = filepath
+        self.chunks = chunks
+        self.decoded = decoded
+
+    def decode(self, chunk):
+        return self.decoded[chunk.offset]
+
+
+# ----------------------------------------------------------------------------
+class CpjMac:
+    """Model actor configuration chunk (MAC) decoded into sections"""
+
+    def __init__(self, directory, chunk):
+        data = directory.data
+        idx = chunk.offset
+
+        # unsigned long numSections; // number of sections
+        # unsigned long ofsSections; // offset of sections in data block
+        # unsigned long numCommands; // number of commands
+        # unsigned long ofsCommands; // offset of command strings in data block
+        SMacFile = struct.unpack_from("IIII", data, idx + 20)
+
+        self.name = chunk.name
+        self.num_commands = SMacFile[2]
+
+        # offset
+        block = idx + 20 + 16
+
+        # command string offsets
+        commands = numpy.frombuffer(data, "<u4", SMacFile[2],
+                                    block + SMacFile[3])
+
+        # read sections
+        self.sections = []
+        shift = block + SMacFile[1]
+        for i in range(SMacFile[0]):
+
+            # unsigned long ofsName // offset of section name string in data block
+            # unsigned long numCommands // number of command strings in section
+            # unsigned long firstCommand // first command string index
+            SMacSection = struct.unpack_from("III", data, shift)
+
+            section = directory.strings.read(block + SMacSection[0])
+            first = SMacSection[2]
+            self.sections.append((section, [
+                directory.strings.read(block + int(ofs))
+                for ofs in commands[first:first + SMacSection[1]]]))
+
+            # next section
+            shift += 12
+
+    def summary(self):
+        return "%d sections, %d commands" % (len(self.sections),
+                                             self.num_commands)
+
+
+# ----------------------------------------------------------------------------
+class CpjGeo:
+    """Geometry chunk (GEO) decoded into NumPy arrays"""
+
+    def __init__(self, directory, chunk):
+        data = directory.data
+        idx = chunk.offset
+
+        # unsigned long numVertices; // number of vertices
+        # unsigned long ofsVertices; // offset of vertices in data block
+        # unsigned long numEdges; // number of edges
+        # unsigned long ofsEdges; // offset of edges in data block
+        # unsigned long numTris; // number of triangles
+        # unsigned long ofsTris; // offset of triangles in data block
+        # unsigned long numMounts; // number of mounts
+        # unsigned long ofsMounts; // offset of mounts in data block
+        # unsigned long numObjLinks; // number of object links
+        # unsigned long ofsObjLinks; // number of object links in data
+        SGeoFile = struct.unpack_from("IIIIIIIIII", data, idx + 20)
+
+        self.name = chunk.name
+        self.num_mounts = SGeoFile[6]
+        self.num_obj_links = SGeoFile[8]
+
+        # decode vertex, edge, triangle and mount arrays in bulk
+        block = idx + 20 + 40
+        self.verts = numpy.frombuffer(data, SGeoVert, SGeoFile[0],
+                                      block + SGeoFile[1])
+        self.edges = numpy.frombuffer(data, SGeoEdge, SGeoFile[2],
+                                      block + SGeoFile[3])
+        self.tris = numpy.frombuffer(data, SGeoTri, SGeoFile[4],
+                                     block + SGeoFile[5])
+        self.mounts = numpy.frombuffer(data, SGeoMount, SGeoFile[6],
+                                       block + SGeoFile[7])
+
+        self.mount_names = [directory.strings.read(block + int(ofs))
+                            for ofs in self.mounts["ofsName"]]
+
+    def summary(self):
+        return "%d verts, %d edges, %d tris, %d mounts" % (
+            len(self.verts), len(self.edges), len(self.tris),
+            self.num_mounts)
+
+
+# ----------------------------------------------------------------------------
+class CpjSrf:
+    """Surface chunk (SRF) decoded into NumPy arrays"""
+
+    def __init__(self, directory, chunk):
+        data = directory.data
+        idx = chunk.offset
+
+        # unsigned long numTextures; // number of textures
+        # unsigned long ofsTextures; // offset of textures in data block
+        # unsigned long numTris; // number of triangles
+        # unsigned long ofsTris; // offset of triangles in data block
+        # unsigned long numUV; // number of UV texture coordinates
+        # unsigned long ofsUV; // offset of UV texture coordinates in data block
+        SSrfFile = struct.unpack_from("IIIIII", data, idx + 20)
+
+        self.name = chunk.name
+
+        # offset
+        block = idx + 20 + 24
+
+        # read textures
+        self.textures = []
+        shift = block + SSrfFile[1]
+        for i in range(SSrfFile[0]):
+
+            # unsigned long ofsName; // offset of texture name string in data block
+            # unsigned long ofsRefName; // offset of optional reference name in block
+            SSrfTex = struct.unpack_from("II", data, shift)
+
+            tex_name = directory.strings.read(block + SSrfTex[0])
+            ref_name = None
+            if SSrfTex[1]:
+                ref_name = directory.strings.read(block + SSrfTex[1])
+            self.textures.append((tex_name, ref_name))
+
+            shift += 8
+
+        # decode triangle and UV tables in bulk
+        self.tris = numpy.frombuffer(data, SSrfTri, SSrfFile[2],
+                                     block + SSrfFile[3])
+        self.uvs = numpy.frombuffer(data, SSrfUV, SSrfFile[4],
+                                    block + SSrfFile[5])
+
+    def summary(self):
+        return "%d textures, %d tris, %d uvs" % (
+            len(self.textures), len(self.tris), len(self.uvs))
+
+
+# ----------------------------------------------------------------------------
+class CpjLodLevel:
+    """Single detail level of LOD chunk"""
+
+    def __init__(self, detail, vert_relay, tris):
+        self.detail = detail
+        self.vert_relay = vert_relay  # LOD vertex to GEO vertex indices
+        self.tris = tris
+
+
+# ----------------------------------------------------------------------------
+class CpjLod:
+    """Level of detail chunk (LOD) decoded into NumPy arrays"""
+
+    def __init__(self, directory, chunk):
+        data = directory.data
+        idx = chunk.offset
+
+        # unsigned long numLevels; // number of detail levels
+        # unsigned long ofsLevels; // offset of detail levels in data block
+        SLodFile = struct.unpack_from("II", data, idx + 20)
+
+        self.name = chunk.name
+
+        # offset
+        block = idx + 20 + 8
+
+        # read levels
+        self.levels = []
+        shift = block + SLodFile[1]
+        for i in range(SLodFile[0]):
+
+            # float detail; // detail level of this LOD
+            # unsigned long numVertRelay; // number of vertices in relay
+            # unsigned long ofsVertRelay; // offset of vertex relay in data block
+            # unsigned long numTriangles; // number of triangles in LOD
+            # unsigned long ofsTriangles; // offset of triangles in data block
+            SLodLevel = struct.unpack_from("fIIII", data, shift)
+
+            self.levels.append(CpjLodLevel(
+                SLodLevel[0],
+                numpy.frombuffer(data, "<u2", SLodLevel[1],
+                                 block + SLodLevel[2]),
+                numpy.frombuffer(data, SLodTri, SLodLevel[3],
+                                 block + SLodLevel[4])))
+
+            shift += 20
+
+    def summary(self):
+        return "%d levels" % len(self.levels)
+
+
+# ----------------------------------------------------------------------------
+class CpjSkl:
+    """Skeleton chunk (SKL) decoded into NumPy arrays"""
+
+    def __init__(self, directory, chunk):
+        data = directory.data
+        idx = chunk.offset
+
+        # unsigned long numBones; // number of bones
+        # unsigned long ofsBones; // offset of bones in data block
+        # unsigned long numVerts; // number of vertices
+        # unsigned long ofsVerts; // offset of vertices in data block
+        # unsigned long numWeights; // number of bone weights
+        # unsigned long ofsWeights; // offset of bone weights in data block
+        # unsigned long numMounts; // number of bone mounts
+        # unsigned long ofsMounts; // offset of bone mounts in data block
+        SSklFile = struct.unpack_from("IIIIIIII", data, idx + 20)
+
+        self.name = chunk.name
+
+        # offset
+        block = idx + 20 + 32
+
+        self.bones = numpy.frombuffer(data, SSklBone, SSklFile[0],
+                                      block + SSklFile[1])
+        self.verts = numpy.frombuffer(data, SSklVert, SSklFile[2],
+                                      block + SSklFile[3])
+        self.weights = numpy.frombuffer(data, SSklWeight, SSklFile[4],
+                                        block + SSklFile[5])
+        self.mounts = numpy.frombuffer(data, SSklMount, SSklFile[6],
+                                       block + SSklFile[7])
+
+        self.bone_names = [directory.strings.read(block + int(ofs))
+                           for ofs in self.bones["ofsName"]]
+        self.mount_names = [directory.strings.read(block + int(ofs))
+                            for ofs in self.mounts["ofsName"]]
+
+    def summary(self):
+        return "%d bones, %d verts, %d weights, %d mounts" % (
+            len(self.bones), len(self.verts), len(self.weights),
+            len(self.mounts))
+
+
+# ----------------------------------------------------------------------------
+class CpjFrm:
+    """Vertex frames chunk (FRM) with frame table decoded"""
+
+    def __init__(self, directory, chunk):
+        data = directory.data
+        idx = chunk.offset
+
+        # CPJVECTOR bbMin; // bounding box minimum
+        # CPJVECTOR bbMax; // bounding box maximum
+        # unsigned long numFrames; // number of frames
+        # unsigned long ofsFrames; // offset of frames in data block
+        SFrmFile = struct.unpack_from("ffffffII", data, idx + 20)
+
+        self.name = chunk.name
+        self.bb_min = SFrmFile[0:3]
+        self.bb_max = SFrmFile[3:6]
+
+        # offset
+        block = idx + 20 + 32
+
+        self.frames = numpy.frombuffer(data, SFrmFrame, SFrmFile[6],
+                                       block + SFrmFile[7])
+        self.frame_names = [directory.strings.read(block + int(ofs))
+                            for ofs in self.frames["ofsFrameName"]]
+
+        # frame payloads are decoded on request from zero-copy view of
+        # the chunk, offsets are relative to start of chunk
+        self.data = memoryview(data)[idx:idx + 8 + chunk.length]
+        self.block = block - idx
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state["data"] = bytes(self.data)
+        return state
+
+    def positions(self, index):
+        """Return vertex positions of frame as (numVerts, 3) float array"""
+        frame = self.frames[index]
+        num_verts = int(frame["numVerts"])
+
+        # uncompressed frame is plain array of CPJVECTOR
+        if frame["numGroups"] == 0:
+            return numpy.frombuffer(
+                self.data, "<f4", num_verts * 3,
+                self.block + int(frame["ofsVerts"])).reshape(num_verts, 3)
+
+        # byte-compressed positions are scaled and translated by group
+        groups = numpy.frombuffer(self.data, SFrmGroup,
+                                  int(frame["numGroups"]),
+                                  self.block + int(frame["ofsGroups"]))
+        verts = numpy.frombuffer(self.data, SFrmBytePos, num_verts,
+                                 self.block + int(frame["ofsVerts"]))
+
+        group = verts["group"]
+        return (verts["pos"] * groups["byteScale"][group]
+                + groups["byteTranslate"][group])
+
+    def summary(self):
+        compressed = numpy.count_nonzero(self.frames["numGroups"])
+        return "%d frames, %d compressed" % (len(self.frames), compressed)
+
+
+# ----------------------------------------------------------------------------
+class CpjSeq:
+    """Sequenced animation chunk (SEQ) decoded into NumPy arrays"""
+
+    def __init__(self, directory, chunk):
+        data = directory.data
+        idx = chunk.offset
+
+        # float playRate; // play rate of sequence in frames per second
+        # unsigned long numFrames; // number of frames
+        # unsigned long ofsFrames; // offset of frames in data block
+        # unsigned long numEvents; // number of events
+        # unsigned long ofsEvents; // offset of events in data block
+        # unsigned long numBoneInfo; // number of bone info entries
+        # unsigned long ofsBoneInfo; // offset of bone info in data block
+        # unsigned long numBoneTranslate; // number of bone translations
+        # unsigned long ofsBoneTranslate; // offset of bone translations
+        # unsigned long numBoneRotate; // number of bone rotations
+        # unsigned long ofsBoneRotate; // offset of bone rotations
+        # unsigned long numBoneScale; // number of bone scales
+        # unsigned long ofsBoneScale; // offset of bone scales
+        SSeqFile = struct.unpack_from("fIIIIIIIIIIII", data, idx + 20)
+
+        self.name = chunk.name
+        self.play_rate = SSeqFile[0]
+
+        # offset
+        block = idx + 20 + 52
+
+        self.frames = numpy.frombuffer(data, SSeqFrame, SSeqFile[1],
+                                       block + SSeqFile[2])
+        self.events = numpy.frombuffer(data, SSeqEvent, SSeqFile[3],
+                                       block + SSeqFile[4])
+        self.bone_info = numpy.frombuffer(data, SSeqBoneInfo, SSeqFile[5],
+                                          block + SSeqFile[6])
+        self.bone_translate = numpy.frombuffer(
+            data, SSeqBoneTranslate, SSeqFile[7], block + SSeqFile[8])
+        self.bone_rotate = numpy.frombuffer(
+            data, SSeqBoneRotate, SSeqFile[9], block + SSeqFile[10])
+        self.bone_scale = numpy.frombuffer(
+            data, SSeqBoneScale, SSeqFile[11], block + SSeqFile[12])
+
+        self.vert_frame_names = [
+            None if ofs == CPJ_NO_OFFSET
+            else directory.strings.read(block + int(ofs))
+            for ofs in self.frames["ofsVertFrameName"]]
+        self.event_params = [
+            None if ofs == CPJ_NO_OFFSET
+            else directory.strings.read(block + int(ofs))
+            for ofs in self.events["ofsParam"]]
+        self.bone_names = [directory.strings.read(block + int(ofs))
+                           for ofs in self.bone_info["ofsName"]]
+
+    def summary(self):
+        return "%d frames at %g fps, %d events, %d bones" % (
+            len(self.frames), self.play_rate, len(self.events),
+            len(self.bone_info))
+
+
+# ----------------------------------------------------------------------------
+CPJ_DECODERS = {
+    CPJ_FRM_MAGIC: CpjFrm,
+    CPJ_GEO_MAGIC: CpjGeo,
+    CPJ_LOD_MAGIC: CpjLod,
+    CPJ_MAC_MAGIC: CpjMac,
+    CPJ_SEQ_MAGIC: CpjSeq,
+    CPJ_SKL_MAGIC: CpjSkl,
+    CPJ_SRF_MAGIC: CpjSrf,
+}
+
+
+# ----------------------------------------------------------------------------
+class CpjStringWriter:
+    """Builder of NUL terminated string pool appended to a data block"""
+
+    def __init__(self, base):
+        self.base = base  # offset of pool in data block
+        self.offsets = {}
+        self.parts = []
+        self.size = 0
+
+    def add(self, value):
+        ofs = self.offsets.get(value)
+        if ofs is None:
+            data = value.encode("utf-8") + b"\0"
+            ofs = self.base + self.size
+            self.offsets[value] = ofs
+            self.parts.append(data)
+            self.size += len(data)
+        return ofs
+
+    def tobytes(self):
+        return b"".join(self.parts)
+
+
+# ----------------------------------------------------------------------------
+def pack_chunk(magic, version, name, header, block, timestamp=0):
+    """Pack chunk header, file header and data block into padded chunk"""
+
+    # chunk name follows data block, offset is from start of chunk
+    name = name.encode("utf-8") + b"\0"
+    ofs_name = 20 + len(header) + len(block)
+    length = ofs_name - 8 + len(name)
+
+    # chunks are 16 bit aligned
+    return b"".join((magic.encode(),
+                     struct.pack("<IIII", length, version, timestamp,
+                                 ofs_name),
+                     header, block, name, b"\0" * (length % 2)))
+
+
+# ----------------------------------------------------------------------------
+def link_table(owners, items, count):
+    """Group items by owner index into first/num/links object link table"""
+    order = numpy.argsort(owners, kind="stable")
+    num = numpy.bincount(owners, minlength=count)
+    first = numpy.cumsum(num) - num
+    return first, num, items[order]
+
+
+# ----------------------------------------------------------------------------
+def check_count(what, count, limit=0xffff):
+    if count > limit:
+        raise ValueError("Too many %s (%d), CPJ allows at most %d" %
+                         (what, count, limit))
+
+
+# ----------------------------------------------------------------------------
+def int32(value):
+    # custom properties are signed 32 bit, chunk values are unsigned
+    return value - 0x100000000 if value > 0x7fffffff else value
+
+
+# ----------------------------------------------------------------------------
+def encode_geo(name, positions, faces, timestamp=0, mounts=()):
+    """Encode vertex positions and triangle vertex indices into GEO chunk
+
+    Mounts are (name, triangle index, barycentric coordinates, scale,
+    rotation quaternion x y z w, translation) tuples.
+    """
+    positions = numpy.asarray(positions, numpy.float32).reshape(-1, 3)
+    faces = numpy.asarray(faces, numpy.int64).reshape(-1, 3)
+    num_verts = len(positions)
+    num_tris = len(faces)
+
+    check_count("vertices", num_verts)
+    check_count("triangles", num_tris)
+
+    # triangle edge k runs from corner k-1 to corner k, so tails are V0-V2
+    heads = faces[:, (2, 0, 1)]
+    keys = heads * num_verts + faces
+
+    # every edge gets a mirror edge, even on open borders
+    edge_keys = numpy.unique(numpy.concatenate((
+        keys.ravel(), faces.ravel() * num_verts + heads.ravel())))
+    num_edges = len(edge_keys)
+    check_count("edges", num_edges)
+
+    edge_heads = edge_keys // num_verts if num_verts else edge_keys
+    edge_tails = edge_keys % num_verts if num_verts else edge_keys
+    ring = numpy.searchsorted(edge_keys, keys)
+    inverted = numpy.searchsorted(edge_keys,
+                                  edge_tails * num_verts + edge_heads)
+
+    # object links of vertices to edges and triangles and edges to triangles
+    edge_index = numpy.arange(num_edges)
+    tri_index = numpy.repeat(numpy.arange(num_tris), 3)
+    vert_edges = link_table(numpy.concatenate((edge_heads, edge_tails)),
+                            numpy.concatenate((edge_index, edge_index)),
+                            num_verts)
+    vert_tris = link_table(faces.ravel(), tri_index, num_verts)
+    edge_tris = link_table(ring.ravel(), tri_index, num_edges)
+    links = numpy.concatenate(
+        (vert_edges[2], vert_tris[2], edge_tris[2])).astype("<u2")
+
+    verts = numpy.zeros(num_verts, SGeoVert)
+    verts["numEdgeLinks"] = vert_edges[1]
+    verts["firstEdgeLink"] = vert_edges[0]
+    verts["numTriLinks"] = vert_tris[1]
+    verts["firstTriLink"] = vert_tris[0] + len(vert_edges[2])
+    verts["refPosition"] = positions
+
+    edges = numpy.zeros(num_edges, SGeoEdge)
+    edges["headVertex"] = edge_heads
+    edges["tailVertex"] = edge_tails
+    edges["invertedEdge"] = inverted
+    edges["numTriLinks"] = edge_tris[1]
+    edges["firstTriLink"] = (edge_tris[0] + len(vert_edges[2])
+                             + len(vert_tris[2]))
+
+    tris = numpy.zeros(num_tris, SGeoTri)
+    tris["edgeRing"] = ring
+
+    # data block is vertices, edges, triangles, mounts, links and strings
+    ofs_edges = verts.nbytes
+    ofs_tris = ofs_edges + edges.nbytes
+    ofs_mounts = ofs_tris + tris.nbytes
+    geo_mounts = numpy.zeros(len(mounts), SGeoMount)
+    ofs_links = ofs_mounts + geo_mounts.nbytes
+    strings = CpjStringWriter(ofs_links + links.nbytes)
+    for mount, values in zip(geo_mounts, mounts):
+        mount_name, tri_index, barys, scale, rotate, translate = values
+        mount["ofsName"] = strings.add(mount_name)
+        mount["triIndex"] = tri_index
+        mount["triBarys"] = barys
+        mount["baseScale"] = scale
+        mount["baseRotate"] = rotate
+        mount["baseTranslate"] = translate
+
+    header = struct.pack("<10I", num_verts, 0, num_edges, ofs_edges,
+                         num_tris, ofs_tris, len(geo_mounts), ofs_mounts,
+                         len(links), ofs_links)
+    block = b"".join((verts.tobytes(), edges.tobytes(), tris.tobytes(),
+                      geo_mounts.tobytes(), links.tobytes(),
+                      strings.tobytes()))
+
+    return pack_chunk(CPJ_GEO_MAGIC, CPJ_GEO_VERSION, name, header, block,
+                      timestamp)
+
+
+# ----------------------------------------------------------------------------
+def encode_srf(name, textures, uv_index, tex_index, uvs, timestamp=0):
+    """Encode textures, triangle UV and texture indices into SRF chunk
+
+    Textures are (tex_name, ref_name or None) pairs like in CpjSrf.
+    """
+    uv_index = numpy.asarray(uv_index).reshape(-1, 3)
+    uvs = numpy.asarray(uvs, numpy.float32).reshape(-1, 2)
+
+    check_count("UVs", len(uvs))
+    check_count("textures", len(textures), 0xff)
+
+    tris = numpy.zeros(len(uv_index), SSrfTri)
+    tris["uvIndex"] = uv_index
+    tris["texIndex"] = tex_index
+
+    srf_uvs = numpy.zeros(len(uvs), SSrfUV)
+    srf_uvs["u"] = uvs[:, 0]
+    srf_uvs["v"] = uvs[:, 1]
+
+    # data block is textures, triangles, UVs and strings
+    ofs_tris = 8 * len(textures)
+    ofs_uvs = ofs_tris + tris.nbytes
+    strings = CpjStringWriter(ofs_uvs + srf_uvs.nbytes)
+    srf_textures = numpy.array([
+        (strings.add(tex_name), strings.add(ref_name) if ref_name else 0)
+        for tex_name, ref_name in textures], "<u4").reshape(-1, 2)
+
+    header = struct.pack("<6I", len(textures), 0, len(tris), ofs_tris,
+                         len(srf_uvs), ofs_uvs)
+    block = b"".join((srf_textures.tobytes(), tris.tobytes(),
+                      srf_uvs.tobytes(), strings.tobytes()))
+
+    return pack_chunk(CPJ_SRF_MAGIC, CPJ_SRF_VERSION, name, header, block,
+                      timestamp)
+
+
+# ----------------------------------------------------------------------------
+def encode_frm(name, frames, timestamp=0, compress=False):
+    """Encode (frame name, positions) pairs into FRM chunk
+
+    With compress, positions are byte-compressed with one group per frame.
+    """
+    positions = [numpy.asarray(pos, "<f4").reshape(-1, 3)
+                 for frame_name, pos in frames]
+
+    bb_min = bb_max = (0.0, 0.0, 0.0)
+    if positions and len(positions[0]):
+        bb_min = numpy.min([pos.min(axis=0) for pos in positions], axis=0)
+        bb_max = numpy.max([pos.max(axis=0) for pos in positions], axis=0)
+
+    # payload of every frame is its groups, if any, and its vertices
+    payloads = []
+    for pos in positions:
+        if not compress:
+            payloads.append((b"", pos.tobytes()))
+            continue
+        group = numpy.zeros(1, SFrmGroup)
+        if len(pos):
+            low = pos.min(axis=0)
+            scale = (pos.max(axis=0) - low) / 255.0
+            scale[scale == 0.0] = 1.0
+            group["byteScale"] = scale
+            group["byteTranslate"] = low
+        verts = numpy.zeros(len(pos), SFrmBytePos)
+        verts["pos"] = numpy.clip(numpy.rint(
+            (pos - group["byteTranslate"]) / group["byteScale"]), 0, 255)
+        payloads.append((group.tobytes(), verts.tobytes()))
+
+    # data block is frames, frame payloads and strings
+    frm_frames = numpy.zeros(len(frames), SFrmFrame)
+    frm_frames["numVerts"] = [len(pos) for pos in positions]
+    ofs = frm_frames.nbytes
+    for frame, (groups, verts) in zip(frm_frames, payloads):
+        if groups:
+            frame["numGroups"] = len(groups) // SFrmGroup.itemsize
+            frame["ofsGroups"] = ofs
+        frame["ofsVerts"] = ofs + len(groups)
+        ofs += len(groups) + len(verts)
+    strings = CpjStringWriter(ofs)
+    frm_frames["ofsFrameName"] = [strings.add(frame_name)
+                                  for frame_name, pos in frames]
+
+    header = struct.pack("<6f2I", *bb_min, *bb_max, len(frames), 0)
+    block = b"".join([frm_frames.tobytes()]
+                     + [groups + verts for groups, verts in payloads]
+                     + [strings.tobytes()])
+
+    return pack_chunk(CPJ_FRM_MAGIC, CPJ_FRM_VERSION, name, header, block,
+                      timestamp)
+
+
+# ----------------------------------------------------------------------------
+def encode_mac(name, sections, timestamp=0):
+    """Encode (section name, [commands]) pairs into MAC chunk"""
+    num_commands = sum(len(commands) for name_, commands in sections)
+
+    # data block is sections, command offsets and strings
+    ofs_commands = 12 * len(sections)
+    strings = CpjStringWriter(ofs_commands + 4 * num_commands)
+    mac_sections = []
+    mac_commands = []
+    for section, commands in sections:
+        mac_sections.append((strings.add(section), len(commands),
+                             len(mac_commands)))
+        mac_commands.extend(strings.add(command) for command in commands)
+
+    header = struct.pack("<4I", len(sections), 0, num_commands, ofs_commands)
+    block = b"".join((
+        numpy.array(mac_sections, "<u4").reshape(-1, 3).tobytes(),
+        numpy.array(mac_commands, "<u4").tobytes(),
+        strings.tobytes()))
+
+    return pack_chunk(CPJ_MAC_MAGIC, CPJ_MAC_VERSION, name, header, block,
+                      timestamp)
+
+
+# ----------------------------------------------------------------------------
+def write_file(filepath, chunks):
+    """Write packed chunks into CPJ file in a single buffered write"""
+    length = 4 + sum(len(chunk) for chunk in chunks)
+    with open(filepath, mode="wb") as handle:
+        handle.write(b"".join([b"RIFF", struct.pack("<I", length), b"CPJB"]
+                              + list(chunks)))
+
+
+# ----------------------------------------------------------------------------
+class CpjActor:
+    """Actor configuration parsed from MAC commands
+
+    Resources are (file, name) references, file is empty for chunks of the
+    same file and name "*" means all chunks of the type.
+    """
+
+    def __init__(self):
+        self.author = ""
+        self.description = ""
+        self.origin = (0.0, 0.0, 0.0)
+        self.scale = (1.0, 1.0, 1.0)
+        self.rotation = (0.0, 0.0, 0.0)  # roll, pitch, yaw in degrees
+        self.geometry = None
+        self.surfaces = {}  # surface index -> reference
+        self.lod = None
+        self.skeleton = None
+        self.frames = []
+        self.sequences = []
+        self.unknown = []  # commands not understood
+
+    @classmethod
+    def from_mac(cls, mac):
+        actor = cls()
+        for section, commands in mac.sections:
+            for command in commands:
+                try:
+                    actor.execute(command)
+                except (ValueError, IndexError):
+                    actor.unknown.append(command)
+        return actor
+
+    def execute(self, command):
+        args = [arg.strip('"') for arg in shlex.split(command, posix=False)]
+        if not args:
+            return
+        name = args[0].lower()
+
+        if name == "setauthor":
+            self.author = " ".join(args[1:])
+        elif name == "setdescription":
+            self.description = " ".join(args[1:])
+        elif name == "setorigin":
+            self.origin = (float(args[1]), float(args[2]), float(args[3]))
+        elif name == "setscale":
+            self.scale = (float(args[1]), float(args[2]), float(args[3]))
+        elif name == "setrotation":
+            self.rotation = (float(args[1]), float(args[2]), float(args[3]))
+        elif name == "setgeometry":
+            self.geometry = parse_reference(args[1])
+        elif name == "setsurface":
+            self.surfaces[int(args[1])] = parse_reference(args[2])
+        elif name == "setloddata":
+            self.lod = parse_reference(args[1])
+        elif name == "setskeleton":
+            self.skeleton = parse_reference(args[1])
+        elif name == "addframes":
+            self.frames.append(parse_reference(args[1]))
+        elif name == "addsequences":
+            self.sequences.append(parse_reference(args[1]))
+        else:
+            self.unknown.append(command)
+
+    def resources(self):
+        """Chunk type and references of configured resources
+
+        Chunk types not configured by the actor are not listed.
+        """
+        surfaces = [self.surfaces[index] for index in sorted(self.surfaces)]
+        return [(magic, [ref for ref in refs if ref is not None])
+                for magic, refs in (
+                    (CPJ_GEO_MAGIC, [self.geometry] if self.geometry else []),
+                    (CPJ_SRF_MAGIC, surfaces),
+                    (CPJ_LOD_MAGIC, [self.lod] if self.lod else []),
+                    (CPJ_SKL_MAGIC, [self.skeleton] if self.skeleton else []),
+                    (CPJ_FRM_MAGIC, self.frames),
+                    (CPJ_SEQ_MAGIC, self.sequences))
+                if refs]
+
+    def summary(self):
+        return "%s%d surfaces, %d frames, %d sequences" % (
+            "geometry '%s', " % self.geometry[1] if self.geometry else "",
+            sum(1 for ref in self.surfaces.values() if ref),
+            len(self.frames), len(self.sequences))
+
+
+# ----------------------------------------------------------------------------
+def parse_reference(text):
+    """Split 'file.cpj\\name' resource reference, None for NULL"""
+    if not text or text.upper() == "NULL":
+        return None
+    path, sep, name = text.replace("\\", "/").rpartition("/")
+    if path.lower().endswith(".cpj"):
+        return (path, name)
+    return ("", text)
+
+
+# ----------------------------------------------------------------------------
+def find_file(directory, path):
+    """Resolve relative path, matching names case-insensitively if needed"""
+    found = os.path.normpath(os.path.join(directory, path))
+    if os.path.exists(found):
+        return found
+
+    found = directory
+    for part in os.path.normpath(path).split(os.sep):
+        try:
+            names = {name.lower(): name for name in os.listdir(found)}
+        except OSError:
+            return None
+        if part not in names.values():
+            part = names.get(part.lower())
+        if part is None:
+            return None
+        found = os.path.join(found, part)
+    return found
+
+
+# ----------------------------------------------------------------------------
+class CpjActorModel(CpjChunkList):
+    """Chunks used by actor configuration, possibly from several files
+
+    Chunk types the actor doesn't configure are taken from the file with
+    the configuration. Chunks are decoded by the directory they come from,
+    only when requested.
+    """
+
+    def __init__(self, directory, actor=None, files=None, paths=None):
+        if actor is None:
+            actor = CpjActor()
+        self.filepath = directory.filepath
+        self.directory = directory
+        self.actor = actor
+        self.files = files or {}  # resolved path -> directory of file
+        self.paths = paths or {}  # referenced path -> resolved path
+        self.sources = {}  # chunk id -> directory
+        self.missing = []  # references not found
+        self.chunks = []
+
+        configured = dict(actor.resources())
+        for magic in CPJ_DECODERS:
+            if magic not in configured:
+                self.add(directory, directory.by_type(magic))
+        for magic, refs in configured.items():
+            for ref in refs:
+                self.add(*self.resolve(directory, magic, ref))
+
+    def add(self, directory, chunks):
+        for chunk in chunks:
+            if id(chunk) not in self.sources:
+                self.sources[id(chunk)] = directory
+                self.chunks.append(chunk)
+
+    def resolve(self, directory, magic, ref):
+        path, name = ref
+        label = "%s '%s'" % (magic, path + "\\" + name if path else name)
+        if path:
+            directory = self.files.get(self.paths.get(path))
+            if directory is None:
+                self.missing.append(label)
+                return None, []
+
+        if name == "*":
+            return directory, directory.by_type(magic)
+
+        chunks = directory.by_name(name, magic) or [
+            chunk for chunk in directory.by_type(magic)
+            if chunk.name.lower() == name.lower()]
+        if not chunks:
+            self.missing.append(label)
+        return directory, chunks[:1]
+
+    def decode(self, chunk):
+        return self.sources[id(chunk)].decode(chunk)
+
+    def source(self, chunk):
+        return self.sources[id(chunk)].source(chunk)
+
+    def close(self):
+        for cpj in self.files.values():
+            if cpj is not self.directory:
+                cpj.close()
+        self.files.clear()
+
+
+# ----------------------------------------------------------------------------
+def open_actor(directory, use_mmap=True, max_workers=None):
+    """Assemble CpjActorModel from first MAC chunk of directory
+
+    Referenced files are found relative to the directory's file and their
+    chunk directories are read in a thread pool. Without MAC chunk, the
+    model has all chunks of the directory.
+    """
+    macs = directory.by_type(CPJ_MAC_MAGIC)
+    if not macs:
+        return CpjActorModel(directory)
+
+    actor = CpjActor.from_mac(directory.decode(macs[0]))
+    base = os.path.dirname(directory.filepath)
+
+    refs = {ref[0] for magic, refs in actor.resources() for ref in refs
+            if ref[0]}
+
+    # references spelling the same file differently, like sub/body.cpj and
+    # sub\Body.cpj, resolve to one path and the file is opened only once;
+    # references to the file itself are common and use its directory
+    paths = {}
+    files = {}
+    resolved = []
+    for ref in sorted(refs):
+        filepath = find_file(base, ref)
+        if filepath is None:
+            continue
+        if os.path.samefile(filepath, directory.filepath):
+            filepath = directory.filepath
+            files[filepath] = directory
+        else:
+            filepath = next((other for other in resolved
+                             if os.path.samefile(filepath, other)), filepath)
+            if filepath not in resolved:
+                resolved.append(filepath)
+        paths[ref] = filepath
+
+    with concurrent.futures.ThreadPoolExecutor(max_workers) as pool:
+        futures = {filepath: pool.submit(CpjFile, filepath, use_mmap)
+                   for filepath in resolved}
+        for filepath, future in futures.items():
+            try:
+                files[filepath] = future.result()
+            except (OSError, ImportError):
+                pass  # reported as missing by CpjActorModel
+
+    return CpjActorModel(directory, actor, files, paths)
+
+
+# ----------------------------------------------------------------------------
+def decode_file(filepath, magics=None, use_mmap=True):
+    """Decode chunks of given types (all if None) into CpjModel"""
+    with CpjFile(filepath, use_mmap) as cpj:
+        cpj.check_supported()
+        decoded = {}
+        for chunk in cpj:
+            if magics is None or chunk.magic in magics:
+                decoded[chunk.offset] = cpj.decode(chunk)
+        return CpjModel(filepath, cpj.chunks, decoded)
+
+
+# ----------------------------------------------------------------------------
+def find_files(paths, pattern="*.cpj", recursive=False):
+    """Expand directories and glob patterns into sorted list of files"""
+    found = []
+    for path in paths:
+        if os.path.isdir(path):
+            if recursive:
+                path = os.path.join(path, "**", pattern)
+            else:
+                path = os.path.join(path, pattern)
+        if any(c in path for c in "*?["):
+            found.extend(sorted(glob.glob(path, recursive=recursive)))
+        else:
+            found.append(path)
+    return found
+
+
+# ----------------------------------------------------------------------------
+def validate(cpj):
+    """Decode all chunks and return list of found problems"""
+    errors = []
+    geo = None
+
+    for chunk in cpj:
+        if chunk.offset + 8 + chunk.length > len(cpj.data):
+            errors.append("%r extends past end of file" % chunk)
+            continue
+
+        if not chunk.supported:
+            errors.append("%r is not supported" % chunk)
+            continue
+
+        try:
+            value = cpj.decode(chunk)
+        except CPJ_DECODE_ERRORS as e:
+            errors.append("%r cannot be decoded: %s" % (chunk, e))
+            continue
+
+        if chunk.magic == CPJ_GEO_MAGIC:
+            geo = value
+            if (exceeds(value.edges["headVertex"], len(value.verts))
+                    or exceeds(value.edges["tailVertex"], len(value.verts))):
+                errors.append("%r has edges with bad vertex index" % chunk)
+            if exceeds(value.tris["edgeRing"], len(value.edges)):
+                errors.append("%r has triangles with bad edge index" % chunk)
+            if exceeds(value.mounts["triIndex"], len(value.tris)):
+                errors.append("%r has mounts with bad triangle index"
+                              % chunk)
+
+        elif chunk.magic == CPJ_SRF_MAGIC:
+            if exceeds(value.tris["uvIndex"], len(value.uvs)):
+                errors.append("%r has triangles with bad UV index" % chunk)
+            if exceeds(value.tris["texIndex"], len(value.textures)):
+                errors.append("%r has triangles with bad texture index"
+                              % chunk)
+            if geo is not None and len(geo.tris) != len(value.tris):
+                errors.append("%r has different number of triangles than "
+                              "GEO" % chunk)
+
+        elif chunk.magic == CPJ_SKL_MAGIC:
+            parents = value.bones["parentIndex"]
+            if exceeds(parents, len(parents)):
+                errors.append("%r has bones with bad parent index" % chunk)
+            if exceeds(value.weights["boneIndex"], len(parents)):
+                errors.append("%r has weights with bad bone index" % chunk)
+
+        elif chunk.magic == CPJ_FRM_MAGIC:
+            if geo is not None and numpy.any(
+                    value.frames["numVerts"] != len(geo.verts)):
+                errors.append("%r has frames with different number of "
+                              "vertices than GEO" % chunk)
+
+        elif chunk.magic == CPJ_LOD_MAGIC:
+            if geo is not None and any(
+                    exceeds(level.vert_relay, len(geo.verts))
+                    for level in value.levels):
+                errors.append("%r has levels with bad vertex relay" % chunk)
+
+    return errors
+
+
+# ----------------------------------------------------------------------------
+def exceeds(indices, count):
+    """True if any index is out of range of count items"""
+    return len(indices) > 0 and indices.max() >= count
+
+
+# ----------------------------------------------------------------------------
+def main(argv=None):
+    import argparse
+    import time
+
+    parser = argparse.ArgumentParser(
+        description="Inspect Cannibal Project (CPJ) files without Blender")
+    parser.add_argument("command", choices=("dump", "validate", "summary"),
+                        help="dump all decoded chunk contents, validate "
+                             "chunks or summarize chunk sizes and counts")
+    parser.add_argument("-r", "--recursive", action="store_true",
+                        help="search directories recursively")
+    parser.add_argument("files", nargs="+", metavar="FILE",
+                        help="CPJ file, directory or glob pattern")
+    args = parser.parse_args(argv)
+    args.files = find_files(args.files, recursive=args.recursive)
+
+    failed = 0
+    total_bytes = 0
+    total_chunks = 0
+    total_time = 0.0
+
+    for filepath in args.files:
+        start = time.perf_counter()
+        try:
+            cpj = CpjFile(filepath)
+        except (OSError, ImportError) + CPJ_DECODE_ERRORS as e:
+            print("%s: %s" % (filepath, e))
+            failed += 1
+            continue
+
+        with cpj:
+            if args.command == "validate":
+                errors = validate(cpj)
+                for error in errors:
+                    print("%s: %s" % (filepath, error))
+                if errors:
+                    failed += 1
+                else:
+                    print("%s: OK" % filepath)
+
+            else:
+                print("%s: %d bytes, %d chunks" % (
+                    filepath, len(cpj.data), len(cpj)))
+
+                for chunk in cpj:
+                    line = "  %s v%d %-24s %10d bytes" % (
+                        chunk.magic, chunk.version, "'%s'" % chunk.name,
+                        chunk.length)
+                    value = None
+                    if chunk.supported:
+                        try:
+                            value = cpj.decode(chunk)
+                            line += "  " + value.summary()
+                        except CPJ_DECODE_ERRORS as e:
+                            line += "  ! %s" % e
+                            failed += 1
+                    print(line)
+
+                    if args.command == "dump" and value is not None:
+                        dump(value)
+
+            total_bytes += len(cpj.data)
+            total_chunks += len(cpj)
+
+        total_time += time.perf_counter() - start
+
+    if args.command == "summary" and len(args.files) > 1:
+        print("%d files, %d bytes, %d chunks, %.3f s" % (
+            len(args.files), total_bytes, total_chunks, total_time))
+
+    return 1 if failed else 0
+
+
+# ----------------------------------------------------------------------------
+def dump(value):
+    if isinstance(value, CpjMac):
+        for section, commands in value.sections:
+            for command in commands:
+                print("    [%s] %s" % (section, command))
+
+    elif isinstance(value, CpjSrf):
+        for tex_name, ref_name in value.textures:
+            print("    texture %s%s" % (
+                tex_name, " (%s)" % ref_name if ref_name else ""))
+
+    elif isinstance(value, CpjLod):
+        for level in value.levels:
+            print("    detail %g: %d verts, %d tris" % (
+                level.detail, len(level.vert_relay), len(level.tris)))
+
+    elif isinstance(value, CpjSkl):
+        for bone, name in zip(value.bones, value.bone_names):
+            print("    bone %s parent %d" % (name, bone["parentIndex"]))
+        for name in value.mount_names:
+            print("    mount %s" % name)
+
+    elif isinstance(value, CpjFrm):
+        for frame, name in zip(value.frames, value.frame_names):
+            print("    frame %s: %d verts, %d groups" % (
+                name, frame["numVerts"], frame["numGroups"]))
+
+    elif isinstance(value, CpjSeq):
+        names = sorted(set(name for name in value.vert_frame_names if name))
+        for name in names:
+            print("    vertex frame %s" % name)
+        for name in value.bone_names:
+            print("    bone %s" % name)
+        for event, param in zip(value.events, value.event_params):
+            print("    event %s at %g: %s" % (
+                struct.pack("<I", event["eventType"]).decode(errors="replace"),
+                event["time"], param))
+
+
+# ----------------------------------------------------------------------------
+if __name__ == "__main__":
+    sys.exit(main())
+
+# EoF
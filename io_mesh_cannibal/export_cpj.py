@@ -19,14 +19,112 @@
 # <pep8 compliant>
 
 # ----------------------------------------------------------------------------
-import struct
-import bpy
+import time
+import logging
+import numpy
+
+from .cpj import encode_geo, encode_srf, write_file
+
+log = logging.getLogger(__name__)
+
+
+# ----------------------------------------------------------------------------
+def save(context, filepath, use_mesh_modifiers=True):
+    bl_object = context.active_object
+    if bl_object is None or bl_object.type != 'MESH':
+        raise ValueError("Active object must be a mesh")
+
+    log.info("Exporting '%s' to %s", bl_object.name, filepath)
+
+    if use_mesh_modifiers:
+        depsgraph = context.evaluated_depsgraph_get()
+        bl_eval = bl_object.evaluated_get(depsgraph)
+    else:
+        bl_eval = bl_object
+    mesh_data = bl_eval.to_mesh()
+
+    try:
+        timestamp = int(time.time())
+        tri_loops, tri_verts = mesh_triangles(mesh_data)
+        chunks = [
+            chunk_geo(bl_object.name, mesh_data, tri_verts, timestamp),
+            chunk_srf(bl_object.name, mesh_data, tri_loops, timestamp),
+        ]
+    finally:
+        bl_eval.to_mesh_clear()
+
+    write_file(filepath, chunks)
+
+    return {'FINISHED'}
+
+
+# ----------------------------------------------------------------------------
+def mesh_triangles(mesh_data):
+    """Triangulated corner loop and vertex indices of mesh"""
+    mesh_data.calc_loop_triangles()
+    num_tris = len(mesh_data.loop_triangles)
+
+    tri_loops = numpy.empty(num_tris * 3, numpy.int32)
+    mesh_data.loop_triangles.foreach_get("loops", tri_loops)
+    tri_verts = numpy.empty(num_tris * 3, numpy.int32)
+    mesh_data.loop_triangles.foreach_get("vertices", tri_verts)
+
+    return tri_loops.reshape(-1, 3), tri_verts.reshape(-1, 3)
 
 
 # ----------------------------------------------------------------------------
-def save(context, filepath):
-    raise Exception('Exporting CPJ is not supported')
-    return {'CANCELLED'}
+def chunk_geo(name, mesh_data, tri_verts, timestamp=0):
+
+    # vertex positions X Z Y
+    co = numpy.empty(len(mesh_data.vertices) * 3, numpy.float32)
+    mesh_data.vertices.foreach_get("co", co)
+    positions = co.reshape(-1, 3)[:, (0, 2, 1)]
+
+    log.info("Geometry Chunk (GEO) '%s': %d vertices, %d tris", name,
+             len(positions), len(tri_verts))
+
+    return encode_geo(name, positions, tri_verts, timestamp)
+
+
+# ----------------------------------------------------------------------------
+def chunk_srf(name, mesh_data, tri_loops, timestamp=0):
+    num_tris = len(tri_loops)
+
+    # materials labeled tex___ref by importer are split back, the label
+    # is kept in cpj_texture when material names were made unique
+    textures = []
+    for mat in mesh_data.materials:
+        label = mat.get("cpj_texture", mat.name) if mat else "default"
+        tex_name, sep, ref_name = label.partition("___")
+        textures.append((tex_name, ref_name or None))
+    if not textures:
+        textures.append(("default", None))
+
+    # texture indices from polygon material indices
+    tri_polys = numpy.empty(num_tris, numpy.int32)
+    mesh_data.loop_triangles.foreach_get("polygon_index", tri_polys)
+    material_index = numpy.empty(len(mesh_data.polygons), numpy.int32)
+    mesh_data.polygons.foreach_get("material_index", material_index)
+    tex_index = numpy.minimum(material_index[tri_polys], len(textures) - 1)
+
+    # UVs of triangle corners, flipped V and shared where equal
+    uv_layer = mesh_data.uv_layers.active
+    if uv_layer is not None:
+        loop_uvs = numpy.empty(len(mesh_data.loops) * 2, numpy.float32)
+        uv_layer.data.foreach_get("uv", loop_uvs)
+        loop_uvs = loop_uvs.reshape(-1, 2)
+        loop_uvs[:, 1] = 1.0 - loop_uvs[:, 1]
+        uvs, uv_index = numpy.unique(loop_uvs[tri_loops.ravel()], axis=0,
+                                     return_inverse=True)
+    else:
+        uvs = numpy.zeros((1, 2), numpy.float32)
+        uv_index = numpy.zeros(num_tris * 3, numpy.int32)
+
+    log.info("Surface Chunk (SRF) '%s': %d textures, %d tris, %d UVs",
+             name, len(textures), num_tris, len(uvs))
+
+    return encode_srf(name, textures, uv_index.reshape(-1, 3), tex_index,
+                      uvs, timestamp)
 
 
 # EoF
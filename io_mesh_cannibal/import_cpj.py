@@ -19,266 +19,723 @@
 # <pep8 compliant>
 
 # ----------------------------------------------------------------------------
-import struct
-import ctypes
+import io
+import os
+import sys
+import math
+import time
+import hashlib
+import logging
 import colorsys
 import random
+import cProfile
+import pstats
+import threading
+import contextlib
+import multiprocessing
+import concurrent.futures
+import numpy
 import bpy
-import bmesh
+import mathutils
+
+from .cpj import (
+    CPJ_FRM_MAGIC,
+    CPJ_GEO_MAGIC,
+    CPJ_LOD_MAGIC,
+    CPJ_MAC_MAGIC,
+    CPJ_SEQ_MAGIC,
+    CPJ_SKL_MAGIC,
+    CPJ_SRF_MAGIC,
+    CPJ_DECODE_ERRORS,
+    SRFTF_HIDDEN,
+    SRFTF_INACTIVE,
+    SRFTF_TRANSPARENT,
+    SRFTF_TWOSIDED,
+    SRFTF_VNIGNORE,
+    CpjActorModel,
+    CpjFile,
+    decode_file,
+    int32,
+    open_actor,
+)
+from .cache import CpjCache
+from . import registry, stream_frm
+
+log = logging.getLogger(__name__)
+
+# chunk types built by import, in build order
+CPJ_BUILD_MAGICS = (CPJ_MAC_MAGIC, CPJ_GEO_MAGIC, CPJ_SRF_MAGIC,
+                    CPJ_LOD_MAGIC, CPJ_FRM_MAGIC, CPJ_SKL_MAGIC,
+                    CPJ_SEQ_MAGIC)
+
+# datablock collections created by import, removed when import is cancelled
+CPJ_IMPORT_DATABLOCKS = ("objects", "meshes", "materials", "images",
+                         "armatures", "actions", "collections")
+
+# SRF triangle flags stored as boolean face attributes
+CPJ_FACE_FLAGS = (("cpj_inactive", SRFTF_INACTIVE),
+                  ("cpj_transparent", SRFTF_TRANSPARENT),
+                  ("cpj_twosided", SRFTF_TWOSIDED))
+
+# shape keys and bone tracks built per build step, long FRM and SEQ chunks
+# are split so background import keeps UI responsive
+CPJ_STEP_FRAMES = 16
+CPJ_STEP_BONES = 8
+
+# chunk types decoded ahead of building in cached and batch import
+CPJ_IMPORT_MAGICS = (CPJ_MAC_MAGIC, CPJ_GEO_MAGIC, CPJ_SRF_MAGIC,
+                     CPJ_SKL_MAGIC, CPJ_LOD_MAGIC, CPJ_SEQ_MAGIC)
 
 
 # ----------------------------------------------------------------------------
-CPJ_HDR_RIFF_MAGIC = struct.unpack("I", b"RIFF")[0]
-CPJ_HDR_FORM_MAGIC = struct.unpack("I", b"CPJB")[0]
+class CpjImportStats:
+    """Per-phase and per-chunk timings and byte counts of one import
+
+    Phases are "scan" (chunk directory or cache), "decode" (chunk payload
+    into arrays) and "build" (Blender datablocks).
+    """
+
+    def __init__(self, filepath):
+        self.filepath = filepath
+        self.phases = {}
+        self.chunks = {}  # chunk id -> [magic, name, bytes, decode, build]
+
+    @contextlib.contextmanager
+    def timer(self, phase, chunk=None):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            seconds = time.perf_counter() - start
+            self.phases[phase] = self.phases.get(phase, 0.0) + seconds
+
+            if chunk is not None:
+                entry = self.chunks.setdefault(id(chunk), [
+                    chunk.magic, chunk.name, chunk.length + 8, 0.0, 0.0])
+                entry[3 if phase == "decode" else 4] += seconds
+                log.debug("%s '%s' %s %.2f ms", chunk.magic, chunk.name,
+                          phase, seconds * 1000.0)
+
+    def decode(self, cpj, chunk):
+        with self.timer("decode", chunk):
+            return cpj.decode(chunk)
+
+    @property
+    def num_bytes(self):
+        return sum(entry[2] for entry in self.chunks.values())
+
+    def slowest(self):
+        """Chunk entry with longest decode and build time, None if empty"""
+        if not self.chunks:
+            return None
+        return max(self.chunks.values(), key=lambda entry: entry[3] + entry[4])
+
+    def summary(self):
+        text = "%s: %d chunks, %d bytes, %s" % (
+            os.path.basename(self.filepath), len(self.chunks),
+            self.num_bytes, ", ".join(
+                "%s %.1f ms" % (phase, seconds * 1000.0)
+                for phase, seconds in self.phases.items()))
+
+        slowest = self.slowest()
+        if slowest:
+            text += " (slowest %s '%s' %.1f ms)" % (
+                slowest[0], slowest[1], (slowest[3] + slowest[4]) * 1000.0)
+
+        return text
 
-CPJ_FRM_MAGIC = "FRMB"
-CPJ_FRM_VERSION = 1
-CPJ_GEO_MAGIC = "GEOB"
-CPJ_GEO_VERSION = 1
-CPJ_LOD_MAGIC = "LODB"
-CPJ_LOD_VERSION = 3
-CPJ_MAC_MAGIC = "MACB"
-CPJ_MAC_VERSION = 1
-CPJ_SEQ_MAGIC = "SEQB"
-CPJ_SEQ_VERSION = 1
-CPJ_SKL_MAGIC = "SKLB"
-CPJ_SKL_VERSION = 1
-CPJ_SRF_MAGIC = "SRFB"
-CPJ_SRF_VERSION = 1
+
+# ----------------------------------------------------------------------------
+@contextlib.contextmanager
+def profiled(enabled, limit=30):
+    """Run block under cProfile and log slowest calls, when enabled"""
+    if not enabled:
+        yield
+        return
+
+    profile = cProfile.Profile()
+    profile.enable()
+    try:
+        yield
+    finally:
+        profile.disable()
+        stream = io.StringIO()
+        pstats.Stats(profile, stream=stream).sort_stats(
+            "cumulative").print_stats(limit)
+        log.info("Profile:\n%s", stream.getvalue())
+
+
+# ----------------------------------------------------------------------------
+def import_magics(frames_mode):
+    if frames_mode in {'NONE', 'STREAM'}:
+        return CPJ_IMPORT_MAGICS
+    return CPJ_IMPORT_MAGICS + (CPJ_FRM_MAGIC,)
 
 
 # ----------------------------------------------------------------------------
-def load(context, filepath):
+def open_model(cpj, use_mmap=True, use_actor=True):
+    """Chunks of cpj to import, assembled by its actor configuration
+
+    Without use_actor, all chunks of cpj are imported.
+    """
+    if not use_actor:
+        return CpjActorModel(cpj)
 
-    # info
-    print("Reading %s..." % filepath)
+    model = open_actor(cpj, use_mmap)
+    if model.files:
+        log.info("Actor %s from %d files", model.actor.summary(),
+                 len({model.source(chunk) for chunk in model}))
+    for label in model.missing:
+        log.warning("cannot find %s used by actor", label)
+    for command in model.actor.unknown:
+        log.debug("ignoring actor command: %s", command)
 
-    # open and read file
-    with open(filepath, mode="rb") as handle:
-        data = handle.read()
+    try:
+        model.check_supported()
+    except ImportError:
+        model.close()
+        raise
 
-        # unsigned long riffMagic; // CPJ_HDR_RIFF_MAGIC
-        # unsigned long lenFile; // length of file following this value
-        # unsigned long formMagic; // CPJ_HDR_FORM_MAGIC
-        SCpjFileHeader = struct.unpack_from("III", data, 0)
+    return model
 
-        if (SCpjFileHeader[0] != CPJ_HDR_RIFF_MAGIC
-                or SCpjFileHeader[2] != CPJ_HDR_FORM_MAGIC):
-            raise ImportError("This file is not a CPJ file")
 
-        if SCpjFileHeader[1] != len(data) - 8:
-            raise ImportError("File has wrong size, propably corrupted")
+# ----------------------------------------------------------------------------
+def load(context, filepath, use_mmap=True, use_cache=False, cache_dir="",
+         cache_size=1024, use_profile=False, use_actor=True, **options):
+    """Import CPJ file, return CpjImportStats of the import"""
+    log.info("Reading %s...", filepath)
+    stats = CpjImportStats(filepath)
+
+    with profiled(use_profile):
+
+        # decoded arrays are reused from cache when file didn't change
+        if use_cache:
+            cache = CpjCache(cache_dir, cache_size * 1024 * 1024)
+            magics = import_magics(options.get("frames_mode", 'SHAPE_KEYS'))
+            with stats.timer("scan"):
+                cpj = cache.load(filepath, magics, use_mmap)
 
-        # compatibility flags
-        bl_object = None
-        has_surface_already = False
+        # scan all chunk headers once, payloads are decoded on demand
+        else:
+            with stats.timer("scan"):
+                cpj = CpjFile(filepath, use_mmap)
 
-        # chunks order workaround
-        # loop 0: MAC
-        # loop 1: GEO
-        # loop 2: SRF
-        # loop 3: rest
-        for loop in range(4):
+        with cpj:
+            cpj.check_supported()
+            with stats.timer("scan"):
+                model = open_model(cpj, use_mmap, use_actor)
+            with model:
+                build(context, model, stats, **options)
 
-            # skip file header
-            idx = 12
+    log.info("%s", stats.summary())
 
-            # loop over all chunks
-            while idx < len(data):
+    return stats
 
-                # unsigned long magic; // chunk-specific magic marker
-                # unsigned long lenFile; // length of chunk following this value
-                # unsigned long version; // chunk-specific format version
-                # unsigned long timeStamp; // time stamp of chunk creation
-                # unsigned long ofsName; // offset of chunk name string from start of chunk
-                #                        // If this value is zero, the chunk is nameless
-                SCpjChunkHeader = struct.unpack_from("IIIII", data, idx)
 
-                # decode chunk type
-                magic = data[idx:idx + 4].decode()
-                version = SCpjChunkHeader[2]
+# ----------------------------------------------------------------------------
+def load_batch(context, filepaths, use_mmap=True, max_workers=0,
+               use_cache=False, cache_dir="", cache_size=1024,
+               use_profile=False, use_actor=True, **options):
+    """Import many files, decoding them in parallel worker processes
+
+    Returns list of (filepath, error) pairs for files that failed, their
+    partially built datablocks are removed.
+    """
+    failed = []
+
+    cache = None
+    if use_cache:
+        cache = CpjCache(cache_dir, cache_size * 1024 * 1024)
+
+    magics = import_magics(options.get("frames_mode", 'SHAPE_KEYS'))
+    with profiled(use_profile):
+        for filepath, result in decode_models(filepaths, magics, use_mmap,
+                                              max_workers, cache):
+            log.info("Reading %s...", filepath)
+
+            if isinstance(result, Exception):
+                log.warning("%s: %s", filepath, result)
+                failed.append((filepath, result))
+                continue
+
+            # files referenced by actor are read and their chunks decoded
+            # in this process
+            stats = CpjImportStats(filepath)
+            existing = datablock_pointers()
+            try:
+                with open_model(result, use_mmap, use_actor) as model:
+                    build(context, model, stats, **options)
+            except (OSError, ImportError) + CPJ_DECODE_ERRORS as e:
+                log.warning("%s: %s", filepath, e)
+                failed.append((filepath, e))
+                remove_datablocks(created_datablocks(existing))
+                continue
+
+            log.info("%s", stats.summary())
+
+    return failed
+
 
-                if SCpjChunkHeader[4] > 0:
-                    name = ctypes.create_string_buffer(
-                        data[idx + SCpjChunkHeader[4]:]).value.decode()
+# ----------------------------------------------------------------------------
+def decode_models(filepaths, magics=None, use_mmap=True, max_workers=0,
+                  cache=None):
+    """Yield (filepath, model or error) pairs in order of filepaths"""
+    errors = (OSError, ImportError) + CPJ_DECODE_ERRORS
+    decode = cache.load if cache else decode_file
+
+    # worker processes are forked, they can't import bpy when spawned;
+    # forking multithreaded Blender is only safe on Linux
+    if (max_workers == 1 or len(filepaths) < 2
+            or not sys.platform.startswith("linux")):
+        for filepath in filepaths:
+            try:
+                yield filepath, decode(filepath, magics, use_mmap)
+            except errors as e:
+                yield filepath, e
+        return
+
+    with concurrent.futures.ProcessPoolExecutor(
+            max_workers=max_workers or None,
+            mp_context=multiprocessing.get_context("fork")) as pool:
+
+        futures = [pool.submit(decode, filepath, magics, use_mmap)
+                   for filepath in filepaths]
+
+        for filepath, future in zip(filepaths, futures):
+            try:
+                yield filepath, future.result()
+            except errors as e:
+                yield filepath, e
+
+
+# ----------------------------------------------------------------------------
+class CpjImportJob:
+    """Import of one file split into background decoding and build steps
+
+    Chunks used by the actor are decoded on a worker thread, datablocks are
+    created on the main thread by step(), which builds chunks until its
+    time budget is used. Cancelling removes all datablocks created by the
+    build steps so far, never ones the user created between them.
+    """
+
+    def __init__(self, filepath, use_mmap=True, use_cache=False,
+                 cache_dir="", cache_size=1024, use_profile=False,
+                 use_actor=True, **options):
+        self.filepath = filepath
+        self.options = options
+        self.stats = CpjImportStats(filepath)
+        self.profile = cProfile.Profile() if use_profile else None
+        self.progress = 0.0
+        self.cpj = None
+        self.model = None
+        self.error = None
+        self.steps = None
+        self.frame_coords = {}  # FRM chunk id -> frame positions
+        self.done = 0
+        self.total = 0
+        self.cancelled = threading.Event()
+        self.created = {name: set() for name in CPJ_IMPORT_DATABLOCKS}
+
+        log.info("Reading %s...", filepath)
+
+        cache = None
+        if use_cache:
+            cache = CpjCache(cache_dir, cache_size * 1024 * 1024)
+
+        self.thread = threading.Thread(target=self.decode,
+                                       args=(use_mmap, cache, use_actor),
+                                       daemon=True)
+        self.thread.start()
+
+    def decode(self, use_mmap, cache, use_actor):
+        """Decode chunks used by import, runs on worker thread
+
+        Decoded chunks are kept by the files, which stay open until the
+        job finishes or is cancelled. Vertex frames are decompressed here
+        too, leaving only shape key creation to the main thread. Any error
+        is kept and raised by step() on the main thread, the worker thread
+        must never die silently.
+        """
+        frames_mode = self.options.get("frames_mode", 'SHAPE_KEYS')
+        magics = import_magics(frames_mode)
+        try:
+            with self.stats.timer("scan"):
+                if cache is not None:
+                    self.cpj = cache.load(self.filepath, magics, use_mmap)
                 else:
-                    name = "nameless"
-
-                # delegate
-                if loop == 0:
-                    if magic == CPJ_MAC_MAGIC and version == CPJ_MAC_VERSION:
-                        chunk_mac(data, idx, name)
-
-                elif loop == 1:
-                    if magic == CPJ_GEO_MAGIC and version == CPJ_GEO_VERSION:
-                        if bl_object:
-                            print("! multiple GEO blocks are not supported")
-                        else:
-                            bl_object = chunk_geo(data, idx, name)
-
-                elif loop == 2:
-                    if magic == CPJ_SRF_MAGIC and version == CPJ_SRF_VERSION:
-                        if has_surface_already:
-                            print("! multiple SRF blocks are not supported")
-                        elif not bl_object:
-                            print("! cannot import SRF without GEO")
-                        else:
-                            chunk_srf(data, idx, name, bl_object)
-                            has_surface_already = True
+                    self.cpj = CpjFile(self.filepath, use_mmap)
+                self.cpj.check_supported()
+                self.model = open_model(self.cpj, use_mmap, use_actor)
+
+            chunks = [chunk for chunk in self.model if chunk.magic in magics]
+            for i, chunk in enumerate(chunks):
+                if self.cancelled.is_set():
+                    return
+                value = self.stats.decode(self.model, chunk)
+                if chunk.magic == CPJ_FRM_MAGIC:
+                    with self.stats.timer("decode", chunk):
+                        coords = decompress_frames(value)
+                    self.frame_coords[id(chunk)] = coords
+                self.progress = 0.5 * (i + 1) / len(chunks)
+
+        except Exception as e:
+            self.error = e
+
+    def step(self, budget=0.02):
+        """Build chunks for at most budget seconds, return True when done"""
+        if self.thread.is_alive():
+            return False
+        if self.error is not None:
+            raise self.error
+        if self.model is None:
+            raise ImportError("Nothing to import from %s, job is closed"
+                              % self.filepath)
+
+        if self.steps is None:
+            self.steps = build_steps(bpy.context, self.model, self.stats,
+                                     frame_coords=self.frame_coords,
+                                     **self.options)
+            self.total = build_count(self.model,
+                                     self.options.get("frames_mode",
+                                                      'SHAPE_KEYS'))
+
+        # UI keeps running between steps, only datablocks appearing during
+        # a step are created by import
+        existing = datablock_pointers()
+        if self.profile:
+            self.profile.enable()
+        try:
+            # at least one chunk is built per step, even over budget
+            start = time.perf_counter()
+            while True:
+                try:
+                    next(self.steps)
+                except StopIteration:
+                    self.progress = 1.0
+                    self.finish()
+                    return True
+                self.done += 1
+                self.progress = min(1.0, 0.5 + 0.5 * self.done
+                                    / max(1, self.total))
+                if time.perf_counter() - start >= budget:
+                    break
+        finally:
+            if self.profile:
+                self.profile.disable()
+            for name, pointers in datablock_pointers().items():
+                self.created[name].update(pointers - existing[name])
+
+        return False
+
+    def close(self):
+        self.frame_coords.clear()
+        if self.model is not None:
+            self.model.close()
+            self.model = None
+        if self.cpj is not None:
+            self.cpj.close()
+            self.cpj = None
+
+    def finish(self):
+        self.close()
+        if self.profile:
+            stream = io.StringIO()
+            pstats.Stats(self.profile, stream=stream).sort_stats(
+                "cumulative").print_stats(30)
+            log.info("Profile:\n%s", stream.getvalue())
+        log.info("%s", self.stats.summary())
+
+    def cancel(self):
+        """Stop decoding and remove datablocks created so far"""
+        self.cancelled.set()
+        self.thread.join()
+        if self.steps is not None:
+            self.steps.close()
+        self.close()
+
+        created = []
+        for name in CPJ_IMPORT_DATABLOCKS:
+            pointers = self.created[name]
+            created.extend(block for block in getattr(bpy.data, name)
+                           if block.as_pointer() in pointers)
+        remove_datablocks(created)
+
+        log.info("%s: cancelled, removed %d datablocks", self.filepath,
+                 len(created))
+
+
+# ----------------------------------------------------------------------------
+def datablock_pointers():
+    """Pointers of datablocks in collections import creates, by collection"""
+    return {name: {block.as_pointer() for block in getattr(bpy.data, name)}
+            for name in CPJ_IMPORT_DATABLOCKS}
+
+
+# ----------------------------------------------------------------------------
+def created_datablocks(existing):
+    """Datablocks missing from pointers of datablock_pointers()"""
+    return [block for name in CPJ_IMPORT_DATABLOCKS
+            for block in getattr(bpy.data, name)
+            if block.as_pointer() not in existing[name]]
+
+
+# ----------------------------------------------------------------------------
+def remove_datablocks(blocks):
+    for block in blocks:
+        if isinstance(block, bpy.types.Object):
+            stream_frm.detach(block)
+    bpy.data.batch_remove(blocks)
+
+
+# ----------------------------------------------------------------------------
+def build(context, cpj, stats=None, **options):
+    """Build datablocks of all chunks at once, return mesh object"""
+    bl_object = None
+    for bl_object in build_steps(context, cpj, stats, **options):
+        pass
+    return bl_object
+
+
+# ----------------------------------------------------------------------------
+def build_count(cpj, frames_mode='SHAPE_KEYS'):
+    """Number of steps yielded by build_steps(), FRM and SEQ chunks split
+    into several steps are estimated from their decoded size"""
+    count = 0
+    for chunk in cpj:
+        if chunk.magic not in CPJ_BUILD_MAGICS:
+            continue
+        count += 1
+        if chunk.magic == CPJ_FRM_MAGIC and frames_mode == 'SHAPE_KEYS':
+            count += (len(cpj.decode(chunk).frames) - 1) // CPJ_STEP_FRAMES
+        elif chunk.magic == CPJ_SEQ_MAGIC:
+            count += len(cpj.decode(chunk).bone_info) // CPJ_STEP_BONES
+    return count
+
 
+# ----------------------------------------------------------------------------
+def build_steps(context, cpj, stats=None, frames_mode='SHAPE_KEYS',
+                stream_cache=64, stream_prefetch=4, import_lod=True,
+                lod_levels="", use_dedup=False, texture_dir="",
+                smooth_mode='SHARP_EDGES', import_mounts=True,
+                frame_coords=None):
+    """Build datablocks chunk by chunk, yield mesh object after each chunk
+
+    Long FRM and SEQ chunks yield every CPJ_STEP_FRAMES shape keys and
+    CPJ_STEP_BONES bone tracks. frame_coords maps FRM chunk ids to frame
+    positions decompressed ahead by decompress_frames().
+
+    With use_dedup, mesh already imported from identical chunks is reused
+    and chunks stored in it (SRF, FRM shape keys, SKL vertex groups, SEQ)
+    are not built again. Meshes with streamed frames are never shared.
+    """
+
+    if stats is None:
+        stats = CpjImportStats(getattr(cpj, "filepath", ""))
+    levels = parse_levels(lod_levels)
+
+    # streamed frames are written into mesh vertices by a frame handler of
+    # every object, a shared mesh would be overwritten by all of them
+    if use_dedup and frames_mode == 'STREAM' and cpj.by_type(CPJ_FRM_MAGIC):
+        log.info("not reusing meshes, vertex frames are streamed")
+        use_dedup = False
+    bl_object = None
+
+    # chunks are dispatched in dependency order: MAC, GEO, SRF, rest
+    for chunk in cpj.by_type(CPJ_MAC_MAGIC):
+        mac = stats.decode(cpj, chunk)
+        with stats.timer("build", chunk):
+            chunk_mac(mac)
+        yield bl_object
+
+    geo = None
+    shared = False
+    for chunk in cpj.by_type(CPJ_GEO_MAGIC):
+        if bl_object:
+            log.warning("multiple GEO blocks are not supported")
+        else:
+            geo = stats.decode(cpj, chunk)
+            with stats.timer("build", chunk):
+                if use_dedup:
+                    digest = mesh_digest(cpj, stats, geo, frames_mode,
+                                         smooth_mode)
+                    mesh_data = registry.meshes.get(digest)
+                    shared = mesh_data is not None
+                    bl_object = chunk_geo(geo, mesh_data)
                 else:
-                    if magic == CPJ_MAC_MAGIC and version == CPJ_MAC_VERSION:
-                        pass
-                    elif magic == CPJ_GEO_MAGIC and version == CPJ_GEO_VERSION:
-                        pass
-                    elif magic == CPJ_SRF_MAGIC and version == CPJ_SRF_VERSION:
-                        pass
-                    elif magic == CPJ_LOD_MAGIC and version == CPJ_LOD_VERSION:
-                        chunk_lod(data, idx, name)
-                    elif magic == CPJ_SKL_MAGIC and version == CPJ_SKL_VERSION:
-                        chunk_skl(data, idx, name)
-                    elif magic == CPJ_FRM_MAGIC and version == CPJ_FRM_VERSION:
-                        chunk_frm(data, idx, name)
-                    elif magic == CPJ_SEQ_MAGIC and version == CPJ_SEQ_VERSION:
-                        chunk_seq(data, idx, name)
-                    else:
-                        raise ImportError("Unsupported %s v%d chunk" %
-                                          (magic, version))
-
-                # seek to next chunk (16 bit aligned)
-                idx += SCpjChunkHeader[1] + (SCpjChunkHeader[1] % 2) + 8
-
-    return {'FINISHED'}
-
-
-# ----------------------------------------------------------------------------
-def chunk_mac(data, idx, name):
-    print("Cannibal Model Actor Configuration Chunk (MAC)")
-
-    # unsigned long numSections; // number of sections
-    # unsigned long ofsSections; // offset of sections in data block
-    # unsigned long numCommands; // number of commands
-    # unsigned long ofsCommands; // offset of command strings in data block
-    SMacFile = struct.unpack_from("IIII", data, idx + 20)
-
-    print("- '%s'" % name)
-    print("- %d Sections" % SMacFile[0])
-    print("- %d Commands" % SMacFile[2])
-
-    # offset
-    block = idx + 20 + 16
-
-    # read sections
-    shift = block + SMacFile[1]
-    for i in range(SMacFile[0]):
-
-        # unsigned long ofsName // offset of section name string in data block
-        # unsigned long numCommands // number of command strings in section
-        # unsigned long firstCommand // first command string index
-        SMacSection = struct.unpack_from("III", data, shift)
-
-        section = ctypes.create_string_buffer(
-            data[block + SMacSection[0]:]).value.decode()
-
-        # read commands
-        count = SMacSection[1]
-        for j in range(count):
-
-            ofs = struct.unpack_from("I", data,
-                                     block + SMacFile[3] + (SMacSection[2] + j) * 4)[0]
-            command = ctypes.create_string_buffer(
-                data[block + ofs:]).value.decode()
-
-            print("+ #%d %s %d/%d : %s" %
-                  (i + 1, section, j + 1, count, command))
-
-        # next section
-        shift += 12
-
-
-# ----------------------------------------------------------------------------
-def chunk_geo(data, idx, name):
-    print("Geometry Chunk (GEO)")
-
-    # unsigned long numVertices; // number of vertices
-    # unsigned long ofsVertices; // offset of vertices in data block
-    # unsigned long numEdges; // number of edges
-    # unsigned long ofsEdges; // offset of edges in data block
-    # unsigned long numTris; // number of triangles
-    # unsigned long ofsTris; // offset of triangles in data block
-    # unsigned long numMounts; // number of mounts
-    # unsigned long ofsMounts; // offset of mounts in data block
-    # unsigned long numObjLinks; // number of object links
-    # unsigned long ofsObjLinks; // number of object links in data
-    SGeoFile = struct.unpack_from("IIIIIIIIII", data, idx + 20)
-
-    print("- '%s'" % name)
-    print("- %d Vertices" % SGeoFile[0])
-    print("- %d Edges" % SGeoFile[2])
-    print("- %d Tris" % SGeoFile[4])
-    print("- %d Mounts" % SGeoFile[6])
-    print("- %d ObjLinks" % SGeoFile[8])
-
-    cpj_verts = []
-    cpj_edges = []
-    cpj_tris = []
-
-    # read all vertices
-    shift = idx + 20 + 40 + SGeoFile[1]
-    for i in range(SGeoFile[0]):
-
-        # unsigned char flags; // GEOVF_ vertex flags
-        # unsigned char groupIndex; // group index for vertex frame compression
-        # unsigned short reserved; // reserved for future use, must be zero
-        # unsigned short numEdgeLinks; // number of edges linked to this vertex
-        # unsigned short numTriLinks; // number of triangles linked to this vertex
-        # unsigned long firstEdgeLink; // first edge index in object link array
-        # unsigned long firstTriLink; // first triangle index in object link array
-        # CPJVECTOR refPosition; // reference position of vertex
-        SGeoVert = struct.unpack_from("BBHHHIIfff", data, shift)
-
-        cpj_verts.append((SGeoVert[7], SGeoVert[9], SGeoVert[8]))  # X Z Y
-        shift += 28
-
-    # read all edges
-    shift = idx + 20 + 40 + SGeoFile[3]
-    for i in range(SGeoFile[2]):
-
-        # unsigned short headVertex; // vertex list index of edge's head vertex
-        # unsigned short tailVertex; // vertex list index of edge's tail vertex
-        # unsigned short invertedEdge; // edge list index of inverted mirror edge
-        # unsigned short numTriLinks; // number of triangles linked to this edge
-        # unsigned long firstTriLink; // first triangle index in object link array
-        SGeoEdge = struct.unpack_from("HHHHI", data, shift)
-
-        cpj_edges.append((SGeoEdge[0], SGeoEdge[1]))
-        shift += 12
-
-    # read all triangles
-    shift = idx + 20 + 40 + SGeoFile[5]
-    for i in range(SGeoFile[4]):
-
-        # unsigned short edgeRing[3]; // edge list indices used by triangle, whose
-        #                             // tail vertices are V0, V1, and V2, in order
-        # unsigned short reserved; // reserved for future use, must be zero
-        SGeoTri = struct.unpack_from("HHHH", data, shift)
-
-        cpj_tris.append((SGeoTri[0], SGeoTri[1], SGeoTri[2]))
-        shift += 8
-
-    # create list of mesh faces
-    bl_faces = []
-    for tris in cpj_tris:
-        v0 = cpj_edges[tris[0]][1]
-        v1 = cpj_edges[tris[1]][1]
-        v2 = cpj_edges[tris[2]][1]
-        bl_faces.append((v0, v1, v2))
-
-    # create mesh and object
-    mesh_data = bpy.data.meshes.new(name)
-    mesh_data.from_pydata(cpj_verts, [], bl_faces)
-    mesh_data.update()
-    obj = bpy.data.objects.new(name, mesh_data)
+                    bl_object = chunk_geo(geo)
+                if import_mounts and len(geo.mounts):
+                    geo_mounts(context, geo, bl_object)
+            record_chunk(bl_object, cpj, chunk)
+        yield bl_object
+
+    srf = None
+    for chunk in cpj.by_type(CPJ_SRF_MAGIC):
+        if srf:
+            log.warning("multiple SRF blocks are not supported")
+        elif not bl_object:
+            log.warning("cannot import SRF without GEO")
+        elif shared:
+            srf = stats.decode(cpj, chunk)
+            record_chunk(bl_object, cpj, chunk)
+        else:
+            srf = stats.decode(cpj, chunk)
+            with stats.timer("build", chunk):
+                chunk_srf(srf, bl_object, texture_dir, geo, smooth_mode)
+            record_chunk(bl_object, cpj, chunk)
+        yield bl_object
+
+    for chunk in cpj.by_type(CPJ_LOD_MAGIC):
+        if not import_lod:
+            log.info("skipping LOD '%s'", chunk.name)
+        elif not bl_object:
+            log.warning("cannot import LOD without GEO")
+        else:
+            lod = stats.decode(cpj, chunk)
+            with stats.timer("build", chunk):
+                chunk_lod(lod, geo, srf, bl_object, levels)
+            record_chunk(bl_object, cpj, chunk)
+        yield bl_object
+
+    for chunk in cpj.by_type(CPJ_FRM_MAGIC):
+        if frames_mode == 'NONE':
+            log.info("skipping FRM '%s'", chunk.name)
+        elif not bl_object:
+            log.warning("cannot import FRM without GEO")
+        elif frames_mode == 'STREAM':
+            with stats.timer("build", chunk):
+                stream_frm.attach(bl_object, cpj.source(chunk), chunk,
+                                  stream_cache, stream_prefetch)
+            record_chunk(bl_object, cpj, chunk)
+        elif shared:
+            record_chunk(bl_object, cpj, chunk)
+        else:
+            frm = stats.decode(cpj, chunk)
+            coords = (frame_coords or {}).get(id(chunk))
+            for _ in timed_steps(stats, chunk,
+                                 chunk_frm(frm, bl_object, coords)):
+                yield bl_object
+            record_chunk(bl_object, cpj, chunk)
+        yield bl_object
+
+    skl = None
+    bl_armature = None
+    for chunk in cpj.by_type(CPJ_SKL_MAGIC):
+        if bl_armature:
+            log.warning("multiple SKL blocks are not supported")
+        else:
+            skl = stats.decode(cpj, chunk)
+            with stats.timer("build", chunk):
+                bl_armature = chunk_skl(context, skl, bl_object,
+                                        use_weights=not shared)
+            if bl_object:
+                record_chunk(bl_object, cpj, chunk)
+        yield bl_object
+
+    for chunk in cpj.by_type(CPJ_SEQ_MAGIC):
+        shape_keys = bl_object.data.shape_keys if bl_object else None
+        if shape_keys and shared:
+            log.info("shape keys of reused mesh are already animated by "
+                     "SEQ '%s'", chunk.name)
+            shape_keys = None
+
+        if not shape_keys and not bl_armature:
+            log.info("skipping SEQ '%s', no vertex frames or skeleton "
+                     "imported", chunk.name)
+        else:
+            seq = stats.decode(cpj, chunk)
+            for _ in timed_steps(stats, chunk,
+                                 chunk_seq(context, seq, shape_keys,
+                                           bl_armature, skl)):
+                yield bl_object
+            if bl_object:
+                record_chunk(bl_object, cpj, chunk)
+        yield bl_object
+
+    # actor placement moves root of imported objects
+    actor = getattr(cpj, "actor", None)
+    bl_root = bl_armature or bl_object
+    if actor is not None and bl_root is not None:
+        bl_root.matrix_basis = actor_matrix(actor)
+
+    # register mesh once all chunks stored in it are built, an import
+    # cancelled before must not be reused
+    if use_dedup and bl_object and not shared:
+        registry.meshes.add(digest, bl_object.data)
+
+
+# ----------------------------------------------------------------------------
+def actor_matrix(actor):
+    """Object matrix of actor SetOrigin, SetScale and SetRotation
+
+    Origin is moved to object center, then scaled and rotated by roll about
+    Z, pitch about X and yaw about Y, like SEQ bone rotations.
+    """
+    roll, pitch, yaw = (math.radians(angle) for angle in actor.rotation)
+    rotate = (mathutils.Quaternion((0.0, 1.0, 0.0), yaw)
+              @ mathutils.Quaternion((1.0, 0.0, 0.0), pitch)
+              @ mathutils.Quaternion((0.0, 0.0, 1.0), roll))
+    matrix = (rotate.to_matrix().to_4x4()
+              @ mathutils.Matrix.Diagonal((*actor.scale, 1.0))
+              @ mathutils.Matrix.Translation([-x for x in actor.origin]))
+
+    # swap Y and Z like vertex positions
+    swap = mathutils.Matrix(((1, 0, 0, 0), (0, 0, 1, 0),
+                             (0, 1, 0, 0), (0, 0, 0, 1)))
+    return swap @ matrix @ swap
+
+
+# ----------------------------------------------------------------------------
+def timed_steps(stats, chunk, steps):
+    """Run build steps of chunk, timing only the work between yields"""
+    while True:
+        with stats.timer("build", chunk):
+            try:
+                next(steps)
+            except StopIteration:
+                return
+        yield
+
+
+# ----------------------------------------------------------------------------
+def chunk_mac(mac):
+    log.info("Cannibal Model Actor Configuration Chunk (MAC) '%s': "
+             "%d sections, %d commands", mac.name, len(mac.sections),
+             mac.num_commands)
+
+    if not log.isEnabledFor(logging.DEBUG):
+        return
+
+    for i, (section, commands) in enumerate(mac.sections):
+        count = len(commands)
+        for j, command in enumerate(commands):
+            log.debug("#%d %s %d/%d : %s", i + 1, section, j + 1, count,
+                      command)
+
+
+# ----------------------------------------------------------------------------
+def chunk_geo(geo, mesh_data=None):
+    log.info("Geometry Chunk (GEO) '%s': %d vertices, %d edges, %d tris, "
+             "%d mounts, %d obj links", geo.name, len(geo.verts),
+             len(geo.edges), len(geo.tris), geo.num_mounts,
+             geo.num_obj_links)
+
+    # linked duplicate of already imported mesh
+    if mesh_data is not None:
+        log.info("reusing mesh '%s'", mesh_data.name)
+
+    else:
+        # vertex positions X Z Y
+        bl_verts = geo_positions(geo.verts)
+
+        # face corners are tail vertices of triangle edge rings
+        bl_faces = geo.edges["tailVertex"][geo.tris["edgeRing"]].astype(
+            numpy.int32)
+
+        mesh_data = bpy.data.meshes.new(geo.name)
+        mesh_from_arrays(mesh_data, bl_verts, bl_faces)
+
+    # create object
+    obj = bpy.data.objects.new(geo.name, mesh_data)
     scene = bpy.context.scene
     scene.collection.objects.link(obj)
 
@@ -286,136 +743,806 @@ def chunk_geo(data, idx, name):
 
 
 # ----------------------------------------------------------------------------
-def chunk_srf(data, idx, name, bl_object):
-    print("Surface Chunk (SRF)")
+def geo_mounts(context, geo, bl_object):
+    """Create empties at mount points, parented to mesh object"""
+    log.info("%d mounts of '%s'", len(geo.mounts), geo.name)
+
+    matrices = mount_matrices(geo)
+
+    # empties are linked to a new collection which is linked to the scene
+    # once, instead of syncing the view layer for every object
+    collection = bpy.data.collections.new(geo.name + " Mounts")
+    objects = collection.objects
+    for name, matrix in zip(geo.mount_names, matrices):
+        empty = bpy.data.objects.new(name, None)
+        empty["cpj_mount"] = name  # found again by refresh
+        empty.empty_display_type = 'ARROWS'
+        empty.parent = bl_object
+        empty.matrix_basis = mathutils.Matrix(matrix.tolist())
+        objects.link(empty)
+    context.scene.collection.children.link(collection)
+
+    return collection
+
+
+# ----------------------------------------------------------------------------
+def mount_matrices(geo):
+    """Mesh space matrices of all mounts
+
+    Mount base transform is relative to its triangle: origin at the
+    barycentric position, X along the first edge and Z along the normal.
+    """
+    mounts = geo.mounts
+    count = len(mounts)
+
+    # frame of mount triangle, identity for bad triangle index
+    frames = numpy.tile(numpy.identity(4), (count, 1, 1))
+    valid = mounts["triIndex"] < len(geo.tris)
+    if valid.any():
+        faces = geo.edges["tailVertex"][
+            geo.tris["edgeRing"][mounts["triIndex"][valid]]]
+        corners = geo.verts["refPosition"][faces].astype(numpy.float64)
+        x = corners[:, 1] - corners[:, 0]
+        z = numpy.cross(x, corners[:, 2] - corners[:, 0])
+        y = numpy.cross(z, x)
+        axes = numpy.stack((x, y, z), axis=2)
+        lengths = numpy.linalg.norm(axes, axis=1, keepdims=True)
+        lengths[lengths == 0.0] = 1.0
+        frames[valid, :3, :3] = axes / lengths
+        frames[valid, :3, 3] = numpy.einsum(
+            "mk,mkj->mj", mounts["triBarys"][valid], corners)
+
+    # base transform is translation, rotation and scale
+    quats = mounts["baseRotate"].astype(numpy.float64)
+    norms = numpy.linalg.norm(quats, axis=1)
+    quats[norms == 0.0] = (0.0, 0.0, 0.0, 1.0)
+    norms[norms == 0.0] = 1.0
+    qx, qy, qz, qw = (quats / norms[:, None]).T
+
+    base = numpy.zeros((count, 4, 4))
+    base[:, 0, 0] = 1.0 - 2.0 * (qy * qy + qz * qz)
+    base[:, 0, 1] = 2.0 * (qx * qy - qz * qw)
+    base[:, 0, 2] = 2.0 * (qx * qz + qy * qw)
+    base[:, 1, 0] = 2.0 * (qx * qy + qz * qw)
+    base[:, 1, 1] = 1.0 - 2.0 * (qx * qx + qz * qz)
+    base[:, 1, 2] = 2.0 * (qy * qz - qx * qw)
+    base[:, 2, 0] = 2.0 * (qx * qz - qy * qw)
+    base[:, 2, 1] = 2.0 * (qy * qz + qx * qw)
+    base[:, 2, 2] = 1.0 - 2.0 * (qx * qx + qy * qy)
+    base[:, :3, :3] *= mounts["baseScale"][:, None, :]
+    base[:, :3, 3] = mounts["baseTranslate"]
+    base[:, 3, 3] = 1.0
+
+    # swap Y and Z like vertex positions
+    swap = (0, 2, 1, 3)
+    return (frames @ base)[:, swap][:, :, swap]
+
+
+# ----------------------------------------------------------------------------
+def mesh_digest(cpj, stats, geo, frames_mode, smooth_mode='NONE'):
+    """Hash of chunk payloads stored in mesh: GEO, SRF, FRM shape keys, SKL
+    vertex groups and SEQ shape key animation"""
+    digest = hashlib.sha1(smooth_mode.encode())
+    for array in (geo.verts, geo.edges, geo.tris):
+        digest.update(array)
+
+    for chunk in cpj.by_type(CPJ_SRF_MAGIC)[:1]:
+        srf = stats.decode(cpj, chunk)
+        digest_names(digest, (name or "" for texture in srf.textures
+                              for name in texture))
+        digest.update(srf.tris)
+        digest.update(srf.uvs)
+
+    for chunk in cpj.by_type(CPJ_SKL_MAGIC)[:1]:
+        skl = stats.decode(cpj, chunk)
+        digest_names(digest, skl.bone_names)
+        for array in (skl.bones, skl.verts, skl.weights):
+            digest.update(array)
+
+    if frames_mode == 'SHAPE_KEYS':
+        # frame payload without chunk header, which holds time stamp
+        for chunk in cpj.by_type(CPJ_FRM_MAGIC):
+            digest.update(stats.decode(cpj, chunk).data[20:])
+
+        for chunk in cpj.by_type(CPJ_SEQ_MAGIC):
+            seq = stats.decode(cpj, chunk)
+            digest.update(numpy.float32(seq.play_rate).tobytes())
+            digest_names(digest, (name or ""
+                                  for name in seq.vert_frame_names))
+
+    return digest.hexdigest()
+
+
+# ----------------------------------------------------------------------------
+def digest_names(digest, names):
+    """Hash strings NUL terminated, independent of the containing sequence"""
+    for name in names:
+        digest.update(name.encode("utf-8") + b"\0")
+
+
+# ----------------------------------------------------------------------------
+def geo_positions(verts):
+    return verts["refPosition"][:, (0, 2, 1)].astype(numpy.float32)
+
+
+# ----------------------------------------------------------------------------
+def mesh_from_arrays(mesh_data, bl_verts, bl_faces):
+    num_verts = len(bl_verts)
+    num_faces = len(bl_faces)
+
+    mesh_data.vertices.add(num_verts)
+    mesh_data.vertices.foreach_set("co", bl_verts.ravel())
+
+    mesh_data.loops.add(num_faces * 3)
+    mesh_data.loops.foreach_set("vertex_index", bl_faces.ravel())
+
+    mesh_data.polygons.add(num_faces)
+    mesh_data.polygons.foreach_set(
+        "loop_start", numpy.arange(0, num_faces * 3, 3, dtype=numpy.int32))
+    mesh_data.polygons.foreach_set(
+        "loop_total", numpy.full(num_faces, 3, dtype=numpy.int32))
+
+    mesh_data.update(calc_edges=True)
+
+
+# ----------------------------------------------------------------------------
+def uvs_from_arrays(mesh_data, name, cpj_uvs, uv_index):
+    bl_uv_layer = mesh_data.uv_layers.new(name=name, do_init=False)
+    bl_uv_layer.data.foreach_set("uv", uv_coords(cpj_uvs, uv_index).ravel())
+
+    return bl_uv_layer
 
-    # unsigned long numTextures; // number of textures
-    # unsigned long ofsTextures; // offset of textures in data block
-    # unsigned long numTris; // number of triangles
-    # unsigned long ofsTris; // offset of triangles in data block
-    # unsigned long numUV; // number of UV texture coordinates
-    # unsigned long ofsUV; // offset of UV texture coordinates in data block
-    SSrfFile = struct.unpack_from("IIIIII", data, idx + 20)
 
-    print("- '%s'" % name)
-    print("- %d numTextures" % SSrfFile[0])
-    print("- %d numTris" % SSrfFile[2])
-    print("- %d numUV" % SSrfFile[4])
+# ----------------------------------------------------------------------------
+def uv_coords(cpj_uvs, uv_index):
+
+    # gather UVs per face corner, loops are stored in triangle order
+    bl_uvs = numpy.empty(uv_index.shape + (2,), dtype=numpy.float32)
+    bl_uvs[..., 0] = cpj_uvs["u"][uv_index]
+    bl_uvs[..., 1] = 1.0 - cpj_uvs["v"][uv_index]
 
-    # create new empty UV layer
-    bl_uv_layer = bl_object.data.uv_layers.new(name=name, do_init=False)
+    return bl_uvs
 
-    # init bmesh with object mesh
-    bm = bmesh.new()
-    bm.from_mesh(bl_object.data)
-    bm.faces.ensure_lookup_table()
-    uv = bm.loops.layers.uv[0]
+
+# ----------------------------------------------------------------------------
+def chunk_srf(srf, bl_object, texture_dir="", geo=None, smooth_mode='NONE'):
+    log.info("Surface Chunk (SRF) '%s': %d textures, %d tris, %d UVs",
+             srf.name, len(srf.textures), len(srf.tris), len(srf.uvs))
+
+    mesh_data = bl_object.data
 
     # check consistency
-    if SSrfFile[2] != len(bm.faces):
+    if len(srf.tris) != len(mesh_data.polygons):
         raise ImportError("Different number of mesh faces in GEO and SRF")
 
-    # offset
-    block = idx + 20 + 24
+    srf_materials(srf, mesh_data, texture_dir)
+
+    # create new UV layer
+    uvs_from_arrays(mesh_data, srf.name, srf.uvs, srf.tris["uvIndex"])
+
+    # set material indices
+    mesh_data.polygons.foreach_set(
+        "material_index", srf.tris["texIndex"].astype(numpy.int32))
+
+    srf_flags(srf, mesh_data)
+
+    if geo is not None and smooth_mode != 'NONE':
+        srf_smoothing(srf, geo, mesh_data, smooth_mode)
+        mesh_data["cpj_smooth"] = smooth_mode
+
+    mesh_data.update()
+
+
+# ----------------------------------------------------------------------------
+def srf_flags(srf, mesh_data):
+    """Hide hidden triangles, store other triangle flags as attributes"""
+    flags = srf.tris["flags"]
+    mesh_data.polygons.foreach_set("hide", (flags & SRFTF_HIDDEN) != 0)
+
+    for name, flag in CPJ_FACE_FLAGS:
+        values = (flags & flag) != 0
+        attribute = mesh_data.attributes.get(name)
+        if attribute is None:
+            if not values.any():
+                continue
+            attribute = mesh_data.attributes.new(name, 'BOOLEAN', 'FACE')
+        attribute.data.foreach_set("value", values)
+
+
+# ----------------------------------------------------------------------------
+def srf_smoothing(srf, geo, mesh_data, smooth_mode='SHARP_EDGES'):
+    """Shade mesh smooth within SRF smoothing groups
+
+    Edges between groups are marked sharp, or with 'SPLIT_NORMALS' loop
+    normals are averaged over triangles of the same group at each vertex.
+    """
+    groups = srf.tris["smoothGroup"]
+    num_faces = len(groups)
+
+    mesh_data.polygons.foreach_set("use_smooth",
+                                   numpy.ones(num_faces, dtype=bool))
+    if hasattr(mesh_data, "use_auto_smooth"):
+        mesh_data.use_auto_smooth = True
+        mesh_data.auto_smooth_angle = math.pi
+
+    if smooth_mode == 'SPLIT_NORMALS':
+        ignore = (srf.tris["flags"] & SRFTF_VNIGNORE) != 0
+        bl_faces = geo.edges["tailVertex"][geo.tris["edgeRing"]]
+        mesh_data.normals_split_custom_set(split_normals(
+            geo_positions(geo.verts), bl_faces, groups, ignore))
+        return
+
+    # vertex pairs of edges sharp in both directions
+    edges = geo.edges[group_edges(geo, groups)]
+    sharp_keys = edge_keys(edges["headVertex"], edges["tailVertex"],
+                           len(geo.verts))
+
+    bl_edges = numpy.empty(len(mesh_data.edges) * 2, dtype=numpy.int32)
+    mesh_data.edges.foreach_get("vertices", bl_edges)
+    sharp = numpy.isin(edge_keys(bl_edges[0::2], bl_edges[1::2],
+                                 len(geo.verts)), sharp_keys)
+
+    # edge property was replaced by attribute in Blender 4
+    if "use_edge_sharp" in bpy.types.MeshEdge.bl_rna.properties:
+        mesh_data.edges.foreach_set("use_edge_sharp", sharp)
+    else:
+        attribute = mesh_data.attributes.get("sharp_edge")
+        if attribute is None:
+            attribute = mesh_data.attributes.new("sharp_edge", 'BOOLEAN',
+                                                 'EDGE')
+        attribute.data.foreach_set("value", sharp)
+
+
+# ----------------------------------------------------------------------------
+def group_edges(geo, groups):
+    """Indices of triangle edges between different smoothing groups
+
+    Neighbour triangle of an edge is the one using its inverted edge.
+    """
+    ring = geo.tris["edgeRing"].ravel().astype(numpy.int64)
+    ring_tris = numpy.repeat(numpy.arange(len(geo.tris)), 3)
+
+    # triangle using each directed edge, -1 for unused edges
+    edge_tris = numpy.full(len(geo.edges) + 1, -1, dtype=numpy.int64)
+    edge_tris[ring] = ring_tris
+
+    # missing mirror edges point past the table to the -1 entry
+    inverted = geo.edges["invertedEdge"][ring].astype(numpy.int64)
+    inverted[inverted >= len(geo.edges)] = len(geo.edges)
+    neighbours = edge_tris[inverted]
+
+    border = neighbours >= 0
+    border[border] = (groups[neighbours[border]]
+                      != groups[ring_tris[border]])
+
+    return ring[border]
+
+
+# ----------------------------------------------------------------------------
+def edge_keys(v1, v2, num_verts):
+    """Undirected edge keys of vertex index pairs"""
+    v1 = v1.astype(numpy.int64)
+    v2 = v2.astype(numpy.int64)
+    return numpy.minimum(v1, v2) * num_verts + numpy.maximum(v1, v2)
+
+
+# ----------------------------------------------------------------------------
+def split_normals(bl_verts, bl_faces, groups, ignore):
+    """Loop normals averaged over faces of the same group at each vertex
+
+    Face normals are weighted by face area, ignored faces don't contribute
+    and get their own normal where no other face does.
+    """
+    corners = bl_verts[bl_faces]
+    face_normals = numpy.cross(corners[:, 1] - corners[:, 0],
+                               corners[:, 2] - corners[:, 0])
+
+    # vertex and smoothing group pairs shared by loops
+    keys = bl_faces.astype(numpy.int64) * 256 + groups[:, None]
+    unique, inverse = numpy.unique(keys.ravel(), return_inverse=True)
+
+    weights = numpy.repeat(numpy.where(ignore[:, None], 0.0, face_normals),
+                           3, axis=0)
+    sums = numpy.empty((len(unique), 3))
+    for axis in range(3):
+        sums[:, axis] = numpy.bincount(inverse, weights[:, axis],
+                                       len(unique))
+
+    loop_normals = sums[inverse]
+    lonely = ~loop_normals.any(axis=1)
+    loop_normals[lonely] = numpy.repeat(face_normals, 3, axis=0)[lonely]
+
+    lengths = numpy.linalg.norm(loop_normals, axis=1)
+    lengths[lengths == 0.0] = 1.0
+
+    return (loop_normals / lengths[:, None]).astype(numpy.float32)
+
+
+# ----------------------------------------------------------------------------
+def srf_materials(srf, mesh_data, texture_dir=""):
+    for tex_name, ref_name in srf.textures:
+        label = tex_name
+        if ref_name:
+            label += "___" + ref_name
+
+        # materials are shared by all meshes using the same texture, one
+        # imported before without texture directory gets its image now
+        mat = registry.materials.get(label)
+        if mat is None:
+            mat = texture_material(label, tex_name, texture_dir)
+            registry.materials.add(label, mat)
+        elif texture_dir and not material_image(mat):
+            texture_image(mat, tex_name, texture_dir)
+        mesh_data.materials.append(mat)
+
+
+# ----------------------------------------------------------------------------
+def texture_material(label, tex_name, texture_dir=""):
+
+    # make new texture with random colors
+    col = colorsys.hls_to_rgb(random.random(), 0.6, 0.8)
+    mat = bpy.data.materials.new(name=label)
+    mat.diffuse_color = (col[0], col[1], col[2], 1.0)
+
+    if texture_dir:
+        texture_image(mat, tex_name, texture_dir)
+
+    return mat
+
+
+# ----------------------------------------------------------------------------
+def material_image(mat):
+    """Image of first image texture node of material, None if none"""
+    if not mat.use_nodes:
+        return None
+    for node in mat.node_tree.nodes:
+        if node.type == 'TEX_IMAGE' and node.image is not None:
+            return node.image
+    return None
+
+
+# ----------------------------------------------------------------------------
+def texture_image(mat, tex_name, texture_dir):
+    image = registry.images.load(texture_dir, tex_name)
+    if image is None:
+        log.warning("texture '%s' not found in %s", tex_name, texture_dir)
+        return None
+
+    # image texture feeds base color of default principled shader
+    mat.use_nodes = True
+    nodes = mat.node_tree.nodes
+    shader = nodes.get("Principled BSDF")
+    node = nodes.new("ShaderNodeTexImage")
+    node.image = image
+    node.location = (-300.0, 300.0)
+    if shader is not None:
+        mat.node_tree.links.new(node.outputs["Color"],
+                                shader.inputs["Base Color"])
+
+    return image
+
+
+# ----------------------------------------------------------------------------
+def record_chunk(bl_object, cpj, chunk):
+    """Remember files and chunk timestamp, offset and size for refresh
+
+    Chunks used by actor can come from other files than the imported one.
+    """
+    if "cpj_chunks" not in bl_object:
+        bl_object["cpj_chunks"] = {}
+    if "cpj_file" not in bl_object:
+        bl_object["cpj_file"] = getattr(cpj, "filepath", "")
+    bl_object["cpj_chunks"][chunk_key(chunk)] = {
+        "file": cpj.source(chunk),
+        "timestamp": int32(chunk.timestamp),
+        "offset": int32(chunk.offset),
+        "length": int32(chunk.length),
+    }
+
+
+# ----------------------------------------------------------------------------
+def chunk_key(chunk):
+    return "%s:%s" % (chunk.magic, chunk.name)
+
 
-    # read textures
-    shift = block + SSrfFile[1]
-    for i in range(SSrfFile[0]):
+# ----------------------------------------------------------------------------
+def parse_levels(text):
+    """Parse comma separated LOD level indices, None means all levels"""
+    if not text.strip():
+        return None
+    try:
+        return {int(level) for level in text.split(",") if level.strip()}
+    except ValueError:
+        raise ImportError("Invalid LOD levels '%s'" % text)
+
+
+# ----------------------------------------------------------------------------
+def chunk_lod(lod, geo, srf, bl_object, levels=None):
+    log.info("Level Of Detail Chunk (LOD) '%s': %d levels", lod.name,
+             len(lod.levels))
+
+    for i, level in enumerate(lod.levels):
+        if levels is not None and i not in levels:
+            continue
+
+        log.debug("#%d detail %g : %d verts, %d tris", i, level.detail,
+                  len(level.vert_relay), len(level.tris))
+
+        # level vertices are relayed to already decoded GEO vertices
+        bl_verts = geo_positions(geo.verts[level.vert_relay])
+        bl_faces = level.tris["vertIndex"].astype(numpy.int32)
+
+        name = "%s_LOD%d" % (bl_object.name, i)
+        mesh_data = bpy.data.meshes.new(name)
+        mesh_from_arrays(mesh_data, bl_verts, bl_faces)
+
+        # share materials and UV table of base mesh
+        if srf:
+            for mat in bl_object.data.materials:
+                mesh_data.materials.append(mat)
+
+            uvs_from_arrays(mesh_data, srf.name, srf.uvs,
+                            level.tris["uvIndex"])
+
+            mesh_data.polygons.foreach_set(
+                "material_index",
+                srf.tris["texIndex"][level.tris["srfTriIndex"]].astype(
+                    numpy.int32))
+
+        mesh_data.update()
+
+        obj = bpy.data.objects.new(name, mesh_data)
+        obj["cpj_lod_detail"] = level.detail
+        obj.parent = bl_object
+        bpy.context.scene.collection.objects.link(obj)
+
+
+# ----------------------------------------------------------------------------
+def chunk_skl(context, skl, bl_object, use_weights=True):
+    log.info("Skeleton Chunk (SKL) '%s': %d bones, %d verts, %d weights",
+             skl.name, len(skl.bones), len(skl.verts), len(skl.weights))
+
+    # bone base transforms are relative to parent bone
+    world = []
+    for bone in skl.bones:
+        rotate = bone["baseRotate"]
+        local = (mathutils.Matrix.Translation(bone["baseTranslate"])
+                 @ mathutils.Quaternion((rotate[3], rotate[0], rotate[1],
+                                         rotate[2])).to_matrix().to_4x4())
+        parent = bone["parentIndex"]
+        world.append(world[parent] @ local if 0 <= parent < len(world)
+                     else local)
+
+    # swap Y and Z like vertex positions
+    swap = mathutils.Matrix(((1, 0, 0, 0), (0, 0, 1, 0),
+                             (0, 1, 0, 0), (0, 0, 0, 1)))
+
+    # create armature object, bones can only be added in edit mode
+    arm_data = bpy.data.armatures.new(skl.name)
+    arm_object = bpy.data.objects.new(skl.name, arm_data)
+    context.scene.collection.objects.link(arm_object)
+    context.view_layer.objects.active = arm_object
+    bpy.ops.object.mode_set(mode='EDIT')
+
+    edit_bones = []
+    for bone, name, matrix in zip(skl.bones, skl.bone_names, world):
+        edit_bone = arm_data.edit_bones.new(name)
+        edit_bone.head = (0.0, 0.0, 0.0)
+        edit_bone.tail = (0.0, float(bone["length"]) or 1.0, 0.0)
+        edit_bone.matrix = swap @ matrix @ swap
+        edit_bones.append(edit_bone)
+
+    for bone, edit_bone in zip(skl.bones, edit_bones):
+        if 0 <= bone["parentIndex"] < len(edit_bones):
+            edit_bone.parent = edit_bones[bone["parentIndex"]]
+
+    bpy.ops.object.mode_set(mode='OBJECT')
+
+    if not bl_object:
+        return arm_object
+
+    # skin mesh to armature
+    bl_object.parent = arm_object
+    modifier = bl_object.modifiers.new(name=skl.name, type='ARMATURE')
+    modifier.object = arm_object
+
+    # vertex groups of a reused mesh are already assigned
+    if not use_weights:
+        return arm_object
+
+    if len(skl.verts) != len(bl_object.data.vertices):
+        log.warning("SKL has %d vertices, mesh has %d", len(skl.verts),
+                    len(bl_object.data.vertices))
+        return arm_object
+
+    chunk_skl_weights(skl, bl_object)
+
+    return arm_object
+
+
+# ----------------------------------------------------------------------------
+def chunk_skl_weights(skl, bl_object):
+
+    # expand per vertex weight ranges into weight and vertex indices
+    counts = skl.verts["numWeights"].astype(numpy.int64)
+    total = int(counts.sum())
+    ranks = numpy.arange(total) - numpy.repeat(numpy.cumsum(counts) - counts,
+                                               counts)
+    weight_index = numpy.repeat(skl.verts["firstWeight"], counts) + ranks
+    vert_index = numpy.repeat(numpy.arange(len(skl.verts)), counts)
+
+    bones = skl.weights["boneIndex"][weight_index]
+    factors = skl.weights["weightFactor"][weight_index]
+
+    # group by bone and weight, then one add() call per distinct weight
+    order = numpy.lexsort((factors, bones))
+    bones = bones[order]
+    factors = factors[order]
+    vert_index = vert_index[order]
+
+    splits = numpy.flatnonzero((numpy.diff(bones) != 0)
+                               | (numpy.diff(factors) != 0)) + 1
+    starts = numpy.concatenate(([0], splits)) if total else []
 
-        # unsigned long ofsName; // offset of texture name string in data block
-        # unsigned long ofsRefName; // offset of optional reference name in block
-        SSrfTex = struct.unpack_from("II", data, shift)
+    groups = [bl_object.vertex_groups.new(name=name)
+              for name in skl.bone_names]
 
-        label = ctypes.create_string_buffer(
-            data[block + SSrfTex[0]:]).value.decode()
-        if SSrfTex[1]:
-            label += "___" + ctypes.create_string_buffer(
-                data[block + SSrfTex[1]:]).value.decode()
+    for start, end in zip(starts, numpy.append(splits, total)):
+        groups[bones[start]].add(vert_index[start:end].tolist(),
+                                 float(factors[start]), 'REPLACE')
 
-        # make new texture with random colors
-        col = colorsys.hls_to_rgb(random.random(), 0.6, 0.8)
-        mat = bpy.data.materials.new(name=label)
-        mat.diffuse_color = (col[0], col[1], col[2], 1.0)
-        bl_object.data.materials.append(mat)
 
-        shift += 8
+# ----------------------------------------------------------------------------
+def chunk_frm(frm, bl_object, coords=None):
+    """Add shape key of every frame, yield every CPJ_STEP_FRAMES frames
+
+    Frame positions are taken from coords when decompressed ahead.
+    """
+    log.info("Vertex Frames Chunk (FRM) '%s': %d frames", frm.name,
+             len(frm.frames))
+
+    num_verts = len(bl_object.data.vertices)
+
+    # reference positions become basis shape key
+    if not bl_object.data.shape_keys:
+        bl_object.shape_key_add(name="Basis", from_mix=False)
+
+    for i, name in enumerate(frm.frame_names):
+        if i and i % CPJ_STEP_FRAMES == 0:
+            yield
+
+        if frm.frames[i]["numVerts"] != num_verts:
+            log.warning("frame '%s' has %d vertices, mesh has %d", name,
+                        frm.frames[i]["numVerts"], num_verts)
+            continue
 
-    # read triangles
-    shift = block + SSrfFile[3]
-    for i in range(SSrfFile[2]):
+        bl_co = coords[i] if coords is not None else frame_co(frm, i)
 
-        # unsigned short uvIndex[3]; // UV texture coordinate indices used
-        # unsigned char texIndex; // surface texture index
-        # unsigned char reserved; // reserved for future use, must be zero
-        # unsigned long flags; // SRFTF_ triangle flags
-        # unsigned char smoothGroup; // light smoothing group
-        # unsigned char alphaLevel; // transparent/modulated alpha level
-        # unsigned char glazeTexIndex; // second-pass glaze texture index if used
-        # unsigned char glazeFunc; // ESrfGlaze second-pass glaze function
-        SSrfTri = struct.unpack_from("HHHBBIBBBB", data, shift)
+        shape_key = bl_object.shape_key_add(name=name, from_mix=False)
+        shape_key.data.foreach_set("co", bl_co)
 
-        # set UVs
-        uv0 = struct.unpack_from(
-            "ff", data, block + SSrfFile[5] + SSrfTri[0] * 8)
-        uv1 = struct.unpack_from(
-            "ff", data, block + SSrfFile[5] + SSrfTri[1] * 8)
-        uv2 = struct.unpack_from(
-            "ff", data, block + SSrfFile[5] + SSrfTri[2] * 8)
-        bm.faces[i].loops[0][uv].uv = (uv0[0], 1.0 - uv0[1])
-        bm.faces[i].loops[1][uv].uv = (uv1[0], 1.0 - uv1[1])
-        bm.faces[i].loops[2][uv].uv = (uv2[0], 1.0 - uv2[1])
 
-        # set material index
-        bm.faces[i].material_index = SSrfTri[3]
+# ----------------------------------------------------------------------------
+def frame_co(frm, index):
+    """Decompress whole frame at once, flat positions X Z Y"""
+    return frm.positions(index)[:, (0, 2, 1)].astype(numpy.float32).ravel()
+
+
+# ----------------------------------------------------------------------------
+def decompress_frames(frm):
+    """Positions of all frames for chunk_frm(), decoded ahead on a worker"""
+    return [frame_co(frm, i) for i in range(len(frm.frames))]
+
 
-        # TODO flags
-        # SRFTF_INACTIVE    = 0x00000001, // triangle is not active
-        # SRFTF_HIDDEN      = 0x00000002, // present but invisible
-        # SRFTF_VNIGNORE    = 0x00000004, // ignored in vertex normal calculations
-        # SRFTF_TRANSPARENT = 0x00000008, // transparent rendering is enabled
-        # SRFTF_UNLIT       = 0x00000020, // not affected by dynamic lighting
-        # SRFTF_TWOSIDED    = 0x00000040, // visible from both sides
-        # SRFTF_MASKING     = 0x00000080, // color key masking is active
-        # SRFTF_MODULATED   = 0x00000100, // modulated rendering is enabled
-        # SRFTF_ENVMAP      = 0x00000200, // environment mapped
-        # SRFTF_NONCOLLIDE  = 0x00000400, // traceray won't collide with this surface
-        # SRFTF_TEXBLEND    = 0x00000800,
-        # SRFTF_ZLATER      = 0x00001000,
-        # SRFTF_RESERVED    = 0x00010000
+# ----------------------------------------------------------------------------
+def chunk_seq(context, seq, shape_keys=None, bl_armature=None, skl=None):
+    """Add actions of sequence, yield every CPJ_STEP_BONES bone tracks"""
+    log.info("Sequenced Animation Chunk (SEQ) '%s': %d frames, %g play "
+             "rate, %d events, %d bones", seq.name, len(seq.frames),
+             seq.play_rate, len(seq.events), len(seq.bone_info))
+
+    # sequence frames are played at playRate, scene at its own frame rate
+    render = context.scene.render
+    step = render.fps / render.fps_base / (seq.play_rate or render.fps)
+    start = context.scene.frame_start
+    bl_frames = (start
+                 + numpy.arange(len(seq.frames), dtype=numpy.float32) * step)
+
+    actions = []
+    if shape_keys:
+        actions.append(seq_shape_keys(seq, shape_keys, bl_frames))
+    if bl_armature and skl:
+        action = yield from seq_bones(seq, skl, bl_armature, bl_frames)
+        actions.append(action)
+
+    # sequence events as markers
+    for action in actions:
+        for event, param in zip(seq.events, seq.event_params):
+            kind = int(event["eventType"]).to_bytes(4, "little").decode(
+                errors="replace")
+            marker = action.pose_markers.new(
+                "%s %s" % (kind, param) if param else kind)
+            marker.frame = int(round(
+                start + event["time"] * len(seq.frames) * step))
 
-        shift += 16
 
-    # update object mesh
-    bm.to_mesh(bl_object.data)
-    bm.free()
+# ----------------------------------------------------------------------------
+def seq_shape_keys(seq, shape_keys, bl_frames):
+    key_blocks = shape_keys.key_blocks
+
+    # shape key index used by each sequence frame, -1 if none
+    lookup = {}
+    frame_keys = numpy.array([
+        lookup.setdefault(name, key_blocks.find(name)) if name else -1
+        for name in seq.vert_frame_names], dtype=numpy.int32)
+
+    action = bpy.data.actions.new(name=seq.name)
+    action.id_root = 'KEY'
+    action.use_fake_user = True
+
+    # one curve per shape key, keyed only where it switches on or off
+    for name, index in lookup.items():
+        if index < 1:
+            continue
+
+        active = (frame_keys == index).astype(numpy.float32)
+        switch = numpy.flatnonzero(numpy.diff(active, prepend=-1.0))
+
+        fcurve_from_arrays(action, 'key_blocks["%s"].value' % name,
+                           bl_frames[switch], active[switch])
+
+    # first sequence is active, rest is kept by fake user
+    if not shape_keys.animation_data:
+        shape_keys.animation_data_create()
+    if not shape_keys.animation_data.action:
+        shape_keys.animation_data.action = action
+
+    return action
+
+
+# ----------------------------------------------------------------------------
+def seq_bones(seq, skl, bl_armature, bl_frames):
+    """Pose bone action from SEQ bone tracks, matched to SKL bones by name
+
+    Yields every CPJ_STEP_BONES bone tracks, returns the action.
+    """
+    bones = {name.lower(): i for i, name in enumerate(skl.bone_names)}
+
+    action = bpy.data.actions.new(name=seq.name)
+    action.id_root = 'OBJECT'
+    action.use_fake_user = True
+
+    # sequence frame and value of every bone key
+    t_frames, translate = seq_keys(seq, seq.bone_translate, "Translate")
+    r_frames, rotate = seq_keys(seq, seq.bone_rotate, "Rotate")
+    s_frames, scale = seq_keys(seq, seq.bone_scale, "Scale")
+
+    # swap Y and Z like armature bones
+    swap = mathutils.Matrix(((1, 0, 0, 0), (0, 0, 1, 0),
+                             (0, 1, 0, 0), (0, 0, 0, 1)))
+
+    for info_index, name in enumerate(seq.bone_names):
+        if info_index and info_index % CPJ_STEP_BONES == 0:
+            yield
+
+        bone_index = bones.get(name.lower())
+        if bone_index is None:
+            log.warning("SEQ '%s' bone '%s' not in SKL '%s'", seq.name,
+                        name, skl.name)
+            continue
+        bone = skl.bones[bone_index]
+        bone_name = skl.bone_names[bone_index]
+
+        t_mask = translate["boneIndex"] == info_index
+        r_mask = rotate["boneIndex"] == info_index
+        s_mask = scale["boneIndex"] == info_index
+        frames = numpy.union1d(numpy.union1d(t_frames[t_mask],
+                                             r_frames[r_mask]),
+                               s_frames[s_mask])
+        if not len(frames):
+            continue
+
+        # untouched channels keep last key, or base transform before it
+        rotate_x, rotate_y, rotate_z, rotate_w = bone["baseRotate"]
+        translates = hold_keys(frames, t_frames[t_mask],
+                               translate["translate"][t_mask],
+                               bone["baseTranslate"])
+        rotates = hold_keys(frames, r_frames[r_mask],
+                            seq_quaternions(rotate[r_mask]),
+                            (rotate_w, rotate_x, rotate_y, rotate_z))
+        scales = hold_keys(frames, s_frames[s_mask],
+                           scale["scale"][s_mask], bone["baseScale"])
+
+        # pose is relative to rest, which is base transform without scale
+        rest = (mathutils.Matrix.Translation(bone["baseTranslate"])
+                @ mathutils.Quaternion((rotate_w, rotate_x, rotate_y,
+                                        rotate_z)).to_matrix().to_4x4())
+        rest_inv = swap @ rest.inverted()
+
+        values = numpy.empty((len(frames), 10), dtype=numpy.float32)
+        for i, (t, r, s) in enumerate(zip(translates, rotates, scales)):
+            local = (mathutils.Matrix.Translation(t)
+                     @ mathutils.Quaternion(r).to_matrix().to_4x4()
+                     @ mathutils.Matrix.Diagonal((*s, 1.0)))
+            location, rotation, size = (rest_inv @ local @ swap).decompose()
+            values[i, 0:3] = location
+            values[i, 3:7] = rotation
+            values[i, 7:10] = size
+
+        path = 'pose.bones["%s"].' % bone_name
+        for column, (prop, index) in enumerate(
+                [("location", i) for i in range(3)]
+                + [("rotation_quaternion", i) for i in range(4)]
+                + [("scale", i) for i in range(3)]):
+            fcurve_from_arrays(action, path + prop, bl_frames[frames],
+                               values[:, column], index, bone_name)
+
+    # first sequence is active, rest is kept by fake user
+    if not bl_armature.animation_data:
+        bl_armature.animation_data_create()
+    if not bl_armature.animation_data.action:
+        bl_armature.animation_data.action = action
+
+    return action
 
 
 # ----------------------------------------------------------------------------
-def chunk_lod(data, idx, name):
-    print("Level Of Detail Chunk (LOD)")
-    print("- '%s'" % name)
-    print("! unsupported")
+def seq_keys(seq, keys, kind):
+    """Sequence frame index of each bone key, frames list their keys in a
+    contiguous range"""
+    counts = seq.frames["numBone" + kind].astype(numpy.intp)
+    frames = numpy.repeat(numpy.arange(len(seq.frames)), counts)
+    starts = numpy.cumsum(counts) - counts
+    index = (numpy.repeat(seq.frames["firstBone" + kind].astype(numpy.intp)
+                          - starts, counts)
+             + numpy.arange(len(frames)))
+    valid = index < len(keys)
+    return frames[valid], keys[index[valid]]
 
 
 # ----------------------------------------------------------------------------
-def chunk_skl(data, idx, name):
-    print("Skeleton Chunk (SKL)")
-    print("- '%s'" % name)
-    print("! unsupported")
+def seq_quaternions(rotate):
+    """Quaternions (w, x, y, z) of roll, pitch and yaw in 64k degrees,
+    applied roll about Z first, then pitch about X, then yaw about Y"""
+    angles = {axis: rotate[field].astype(numpy.float64) * math.pi / 32768.0
+              for axis, field in (("z", "roll"), ("x", "pitch"),
+                                  ("y", "yaw"))}
+    quats = numpy.empty((len(rotate), 4), dtype=numpy.float32)
+    for i, (roll, pitch, yaw) in enumerate(zip(angles["z"], angles["x"],
+                                               angles["y"])):
+        quats[i] = (mathutils.Quaternion((0.0, 1.0, 0.0), yaw)
+                    @ mathutils.Quaternion((1.0, 0.0, 0.0), pitch)
+                    @ mathutils.Quaternion((0.0, 0.0, 1.0), roll))
+    return quats
 
 
 # ----------------------------------------------------------------------------
-def chunk_frm(data, idx, name):
-    print("Vertex Frames Chunk (FRM)")
-    print("- '%s'" % name)
-    print("! unsupported")
+def hold_keys(frames, key_frames, key_values, base):
+    """Value at each frame from the last key at or before it, base if none"""
+    values = numpy.concatenate((numpy.reshape(base, (1, -1)), key_values))
+    index = numpy.searchsorted(key_frames, frames, side="right")
+    return values[index]
 
 
 # ----------------------------------------------------------------------------
-def chunk_seq(data, idx, name):
-    print("Sequenced Animation Chunk (SEQ)")
-    print("- '%s'" % name)
-    print("! unsupported")
+def fcurve_from_arrays(action, data_path, frames, values, index=0,
+                       group=None):
+    fcurve = action.fcurves.new(data_path, index=index,
+                                action_group=group or "")
+
+    coords = numpy.empty((len(frames), 2), dtype=numpy.float32)
+    coords[:, 0] = frames
+    coords[:, 1] = values
+
+    # insert all keyframes at once, constant interpolation matches
+    # discrete frames of CPJ sequences
+    fcurve.keyframe_points.add(len(frames))
+    fcurve.keyframe_points.foreach_set("co", coords.ravel())
+    fcurve.keyframe_points.foreach_set(
+        "interpolation", numpy.zeros(len(frames), dtype=numpy.int32))
+    fcurve.update()
+
+    return fcurve
 
 
 # EoF
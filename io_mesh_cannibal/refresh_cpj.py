@@ -0,0 +1,274 @@
+# ##### BEGIN GPL LICENSE BLOCK #####
+#
+#  This program is free software; you can redistribute it and/or
+#  modify it under the terms of the GNU General Public License
+#  as published by the Free Software Foundation; either version 2
+#  of the License, or (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with this program; if not, write to the Free Software Foundation,
+#  Inc., 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301, USA.
+#
+# ##### END GPL LICENSE BLOCK #####
+
+# <pep8 compliant>
+
+
+# ----------------------------------------------------------------------------
+import logging
+import contextlib
+import numpy
+import bpy
+import mathutils
+
+from .cpj import (
+    CPJ_FRM_MAGIC,
+    CPJ_GEO_MAGIC,
+    CPJ_LOD_MAGIC,
+    CPJ_SEQ_MAGIC,
+    CPJ_SKL_MAGIC,
+    CPJ_SRF_MAGIC,
+    CpjFile,
+)
+from .import_cpj import (
+    chunk_key,
+    geo_positions,
+    int32,
+    mesh_from_arrays,
+    mount_matrices,
+    record_chunk,
+    srf_flags,
+    srf_materials,
+    srf_smoothing,
+    uv_coords,
+    uvs_from_arrays,
+)
+from . import stream_frm
+
+log = logging.getLogger(__name__)
+
+
+# ----------------------------------------------------------------------------
+def refresh(context, bl_object, use_mmap=True):
+    """Update imported object from chunks changed since import
+
+    Returns list of refreshed chunk keys.
+    """
+    filepath = bl_object["cpj_file"]
+    records = bl_object["cpj_chunks"]
+    refreshed = []
+
+    # chunks used by actor can come from other files than the imported one
+    paths = sorted({record.get("file", filepath)
+                    for record in records.values()})
+
+    log.info("Refreshing '%s' from %s...", bl_object.name, ", ".join(
+        bpy.path.abspath(path) for path in paths))
+
+    with contextlib.ExitStack() as stack:
+
+        # chunks are matched by type and name, offsets move when other
+        # chunks change size
+        recorded = {}
+        changed = {}
+        for path in paths:
+            cpj = stack.enter_context(
+                CpjFile(bpy.path.abspath(path), use_mmap))
+            cpj.check_supported()
+
+            for chunk in cpj:
+                record = records.get(chunk_key(chunk))
+                if record is None or record.get("file", filepath) != path:
+                    continue
+                recorded.setdefault(chunk.magic, []).append((cpj, chunk))
+                if (record["timestamp"] != int32(chunk.timestamp)
+                        or record["length"] != int32(chunk.length)):
+                    changed.setdefault(chunk.magic, []).append((cpj, chunk))
+                elif record["offset"] != int32(chunk.offset):
+                    record_chunk(bl_object, cpj, chunk)
+                    if (chunk.magic == CPJ_FRM_MAGIC
+                            and "cpj_stream_file" in bl_object):
+                        bl_object["cpj_stream_chunk"] = int32(chunk.offset)
+                        stream_frm.detach(bl_object)
+
+        # mesh shared by Reuse Meshes gets its own copy, objects of other
+        # files keep their unchanged mesh
+        if (changed.keys() & {CPJ_GEO_MAGIC, CPJ_SRF_MAGIC, CPJ_FRM_MAGIC}
+                and bl_object.data.users > 1):
+            log.info("'%s' shares mesh '%s', refreshing a copy",
+                     bl_object.name, bl_object.data.name)
+            bl_object.data = bl_object.data.copy()
+
+        # new topology drops UVs and shape keys, they are rebuilt too;
+        # vertex weights and shape key actions are lost, LOD meshes copy
+        # GEO positions and are stale after any change
+        stale = []
+        for cpj, chunk in changed.get(CPJ_GEO_MAGIC, ()):
+            geo = cpj.decode(chunk)
+            magics = [CPJ_LOD_MAGIC]
+            refresh_mounts(geo, bl_object)
+            if not refresh_geo(geo, bl_object):
+                for magic in (CPJ_SRF_MAGIC, CPJ_FRM_MAGIC):
+                    changed[magic] = recorded.get(magic, [])
+                magics += [CPJ_SKL_MAGIC, CPJ_SEQ_MAGIC]
+            stale = [chunk_key(other) for magic in magics
+                     if magic not in changed
+                     for other_cpj, other in recorded.get(magic, ())]
+
+        for cpj, chunk in changed.get(CPJ_SRF_MAGIC, ()):
+            refresh_srf(cpj.decode(chunk), bl_object)
+
+        # smoothing depends on positions and groups
+        smooth_mode = bl_object.data.get("cpj_smooth")
+        if smooth_mode and (CPJ_GEO_MAGIC in changed
+                            or CPJ_SRF_MAGIC in changed):
+            geos = recorded.get(CPJ_GEO_MAGIC)
+            srfs = recorded.get(CPJ_SRF_MAGIC)
+            if geos and srfs:
+                srf_smoothing(srfs[0][0].decode(srfs[0][1]),
+                              geos[0][0].decode(geos[0][1]),
+                              bl_object.data, smooth_mode)
+
+        for cpj, chunk in changed.get(CPJ_FRM_MAGIC, ()):
+            if "cpj_stream_file" in bl_object:
+                bl_object["cpj_stream_chunk"] = int32(chunk.offset)
+                stream_frm.detach(bl_object)
+                stream_frm.update_object(bl_object, context.scene)
+            else:
+                refresh_frm(cpj.decode(chunk), bl_object)
+
+        for magic, chunks in changed.items():
+            for cpj, chunk in chunks:
+                if magic in (CPJ_GEO_MAGIC, CPJ_SRF_MAGIC, CPJ_FRM_MAGIC):
+                    record_chunk(bl_object, cpj, chunk)
+                    refreshed.append(chunk_key(chunk))
+                else:
+                    log.warning("%s changed, import file again to update "
+                                "it", chunk_key(chunk))
+        for key in stale:
+            log.warning("%s is stale after GEO changed, import file again "
+                        "to update it", key)
+
+    # content no longer matches chunks it was deduplicated by
+    if refreshed:
+        bl_object.data.pop("cpj_digest", None)
+
+    bl_object.data.update()
+
+    return refreshed
+
+
+# ----------------------------------------------------------------------------
+def refresh_geo(geo, bl_object):
+    """Update vertex positions in place, rebuild mesh if topology changed
+
+    Returns False when mesh was rebuilt.
+    """
+    log.info("Geometry Chunk (GEO) '%s' changed", geo.name)
+
+    mesh_data = bl_object.data
+    bl_verts = geo_positions(geo.verts)
+    bl_faces = geo.edges["tailVertex"][geo.tris["edgeRing"]].astype(numpy.int32)
+
+    # same vertices and triangles, only positions moved
+    if (len(bl_verts) == len(mesh_data.vertices)
+            and len(bl_faces) == len(mesh_data.polygons)
+            and len(mesh_data.loops) == bl_faces.size):
+        loops = numpy.empty(len(mesh_data.loops), dtype=numpy.int32)
+        mesh_data.loops.foreach_get("vertex_index", loops)
+        if numpy.array_equal(loops, bl_faces.ravel()):
+            mesh_data.vertices.foreach_set("co", bl_verts.ravel())
+            if mesh_data.shape_keys:
+                mesh_data.shape_keys.reference_key.data.foreach_set(
+                    "co", bl_verts.ravel())
+            return True
+
+    # same datablock, new geometry
+    bl_object.shape_key_clear()
+    mesh_data.clear_geometry()
+    mesh_from_arrays(mesh_data, bl_verts, bl_faces)
+
+    return False
+
+
+# ----------------------------------------------------------------------------
+def refresh_mounts(geo, bl_object):
+    """Move mount empties to triangle frames of changed GEO"""
+    empties = [child for child in bl_object.children if "cpj_mount" in child]
+    if not empties:
+        return
+
+    matrices = dict(zip(geo.mount_names, mount_matrices(geo)))
+    for empty in empties:
+        matrix = matrices.pop(empty["cpj_mount"], None)
+        if matrix is None:
+            log.warning("mount '%s' was removed from GEO '%s'",
+                        empty["cpj_mount"], geo.name)
+        else:
+            empty.matrix_basis = mathutils.Matrix(matrix.tolist())
+
+    for name in matrices:
+        log.warning("mount '%s' was added to GEO '%s', import file again "
+                    "to add it", name, geo.name)
+
+
+# ----------------------------------------------------------------------------
+def refresh_srf(srf, bl_object):
+    log.info("Surface Chunk (SRF) '%s' changed", srf.name)
+
+    mesh_data = bl_object.data
+    if len(srf.tris) != len(mesh_data.polygons):
+        raise ImportError("Different number of mesh faces in GEO and SRF")
+
+    # material slots are replaced only when texture list changed
+    labels = [tex_name + ("___" + ref_name if ref_name else "")
+              for tex_name, ref_name in srf.textures]
+    if labels != [mat.get("cpj_texture", mat.name) if mat else ""
+                  for mat in mesh_data.materials]:
+        mesh_data.materials.clear()
+        srf_materials(srf, mesh_data)
+
+    uv_index = srf.tris["uvIndex"]
+    bl_uv_layer = mesh_data.uv_layers.get(srf.name)
+    if bl_uv_layer is None or len(bl_uv_layer.data) != uv_index.size:
+        uvs_from_arrays(mesh_data, srf.name, srf.uvs, uv_index)
+    else:
+        bl_uv_layer.data.foreach_set("uv",
+                                     uv_coords(srf.uvs, uv_index).ravel())
+
+    mesh_data.polygons.foreach_set(
+        "material_index", srf.tris["texIndex"].astype(numpy.int32))
+
+    srf_flags(srf, mesh_data)
+
+
+# ----------------------------------------------------------------------------
+def refresh_frm(frm, bl_object):
+    log.info("Vertex Frames Chunk (FRM) '%s' changed", frm.name)
+
+    num_verts = len(bl_object.data.vertices)
+    if not bl_object.data.shape_keys:
+        bl_object.shape_key_add(name="Basis", from_mix=False)
+    key_blocks = bl_object.data.shape_keys.key_blocks
+
+    # existing shape keys are updated, new frames are added
+    for i, name in enumerate(frm.frame_names):
+        if frm.frames[i]["numVerts"] != num_verts:
+            log.warning("frame '%s' has %d vertices, mesh has %d", name,
+                        frm.frames[i]["numVerts"], num_verts)
+            continue
+
+        bl_co = frm.positions(i)[:, (0, 2, 1)].astype(numpy.float32)
+
+        shape_key = key_blocks.get(name)
+        if shape_key is None:
+            shape_key = bl_object.shape_key_add(name=name, from_mix=False)
+        shape_key.data.foreach_set("co", bl_co.ravel())
+
+
+# EoF
@@ -0,0 +1,160 @@
+# ##### BEGIN GPL LICENSE BLOCK #####
+#
+#  This program is free software; you can redistribute it and/or
+#  modify it under the terms of the GNU General Public License
+#  as published by the Free Software Foundation; either version 2
+#  of the License, or (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with this program; if not, write to the Free Software Foundation,
+#  Inc., 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301, USA.
+#
+# ##### END GPL LICENSE BLOCK #####
+
+# <pep8 compliant>
+
+
+# ----------------------------------------------------------------------------
+import os
+import bpy
+
+# image file types searched for texture names, in order of preference;
+# only types Blender reads, an unreadable image would count as textured
+CPJ_IMAGE_EXTENSIONS = (".png", ".tga", ".bmp", ".dds", ".jpg", ".jpeg")
+
+
+# ----------------------------------------------------------------------------
+class CpjRegistry:
+    """Index of imported datablocks keyed by content of their CPJ chunks
+
+    Keys are stored as custom property of datablocks, so they are found
+    again across imports and after saving and reloading blend files. The
+    index maps keys to datablock names and is checked on every lookup,
+    renamed or removed datablocks are never returned.
+    """
+
+    def __init__(self, collection, prop):
+        self.collection = collection  # name of bpy.data collection
+        self.prop = prop  # custom property holding key
+        self.index = None
+
+    def blocks(self):
+        return getattr(bpy.data, self.collection)
+
+    def rebuild(self):
+        self.index = {block[self.prop]: block.name for block in self.blocks()
+                      if self.prop in block}
+
+    def lookup(self, key):
+        block = self.blocks().get(self.index.get(key, ""))
+        if block is not None and block.get(self.prop) == key:
+            return block
+        return None
+
+    def get(self, key):
+        if self.index is None:
+            self.rebuild()
+
+        block = self.lookup(key)
+        if block is None and key in self.index:
+            self.rebuild()  # stale entry, datablock renamed or removed
+            block = self.lookup(key)
+
+        return block
+
+    def add(self, key, block):
+        if self.index is None:
+            self.rebuild()
+        block[self.prop] = key
+        self.index[key] = block.name
+
+    def clear(self):
+        self.index = None
+
+
+# ----------------------------------------------------------------------------
+class CpjImageCache:
+    """Texture images found by name in texture directories, loaded once
+
+    Directory listings are read once, images are loaded only when first
+    requested and shared by all materials using them.
+    """
+
+    def __init__(self):
+        self.listings = {}  # directory -> {lower case file stem: [paths]}
+
+    def listing(self, directory):
+        files = self.listings.get(directory)
+        if files is None:
+            files = {}
+            try:
+                entries = list(os.scandir(directory))
+            except OSError:
+                entries = []
+            for entry in entries:
+                stem, ext = os.path.splitext(entry.name)
+                if ext.lower() in CPJ_IMAGE_EXTENSIONS and entry.is_file():
+                    files.setdefault(stem.lower(), []).append(entry.path)
+            for stem, paths in files.items():
+                paths.sort(key=lambda path: CPJ_IMAGE_EXTENSIONS.index(
+                    os.path.splitext(path)[1].lower()))
+            self.listings[directory] = files
+        return files
+
+    def find(self, directory, name):
+        """Path of image named like texture, also without package prefix"""
+        files = self.listing(bpy.path.abspath(directory))
+        for stem in (name, name.replace("\\", "/").rsplit("/", 1)[-1],
+                     name.rsplit(".", 1)[-1]):
+            paths = files.get(stem.lower())
+            if paths:
+                return paths[0]
+        return None
+
+    def load(self, directory, name):
+        path = self.find(directory, name)
+        if path is None:
+            return None
+        return bpy.data.images.load(path, check_existing=True)
+
+    def clear(self):
+        self.listings.clear()
+
+
+# ----------------------------------------------------------------------------
+meshes = CpjRegistry("meshes", "cpj_digest")
+materials = CpjRegistry("materials", "cpj_texture")
+images = CpjImageCache()
+
+
+# ----------------------------------------------------------------------------
+def clear_all():
+    meshes.clear()
+    materials.clear()
+    images.clear()
+
+
+# ----------------------------------------------------------------------------
+@bpy.app.handlers.persistent
+def on_load(*args):
+    clear_all()
+
+
+# ----------------------------------------------------------------------------
+def register():
+    bpy.app.handlers.load_post.append(on_load)
+
+
+# ----------------------------------------------------------------------------
+def unregister():
+    if on_load in bpy.app.handlers.load_post:
+        bpy.app.handlers.load_post.remove(on_load)
+    clear_all()
+
+
+# EoF
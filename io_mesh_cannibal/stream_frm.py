@@ -0,0 +1,237 @@
+# ##### BEGIN GPL LICENSE BLOCK #####
+#
+#  This program is free software; you can redistribute it and/or
+#  modify it under the terms of the GNU General Public License
+#  as published by the Free Software Foundation; either version 2
+#  of the License, or (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with this program; if not, write to the Free Software Foundation,
+#  Inc., 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301, USA.
+#
+# ##### END GPL LICENSE BLOCK #####
+
+# <pep8 compliant>
+
+# ----------------------------------------------------------------------------
+import logging
+import threading
+import collections
+import concurrent.futures
+import numpy
+import bpy
+
+from .cpj import (
+    CPJ_FRM_MAGIC,
+    CpjFile,
+    int32,
+)
+
+log = logging.getLogger(__name__)
+
+
+# ----------------------------------------------------------------------------
+class CpjFrameCache:
+    """Bounded LRU cache of decoded vertex frames"""
+
+    def __init__(self, max_frames):
+        self.max_frames = max(1, max_frames)
+        self.frames = collections.OrderedDict()
+        self.lock = threading.Lock()
+
+    def __contains__(self, index):
+        with self.lock:
+            return index in self.frames
+
+    def get(self, index):
+        with self.lock:
+            co = self.frames.get(index)
+            if co is not None:
+                self.frames.move_to_end(index)
+            return co
+
+    def put(self, index, co):
+        with self.lock:
+            self.frames[index] = co
+            self.frames.move_to_end(index)
+            while len(self.frames) > self.max_frames:
+                self.frames.popitem(last=False)
+
+    def clear(self):
+        with self.lock:
+            self.frames.clear()
+
+
+# ----------------------------------------------------------------------------
+class CpjFrameStream:
+    """Vertex frames of FRM chunk decoded on demand from mapped file
+
+    Chunk offset may be given signed, as stored in custom properties.
+    """
+
+    def __init__(self, filepath, offset, max_frames=64, prefetch=0):
+        self.cpj = CpjFile(filepath)
+
+        offset &= 0xffffffff
+        chunk = None
+        for item in self.cpj.by_type(CPJ_FRM_MAGIC):
+            if item.offset == offset:
+                chunk = item
+        if chunk is None:
+            self.cpj.close()
+            raise ImportError("FRM chunk not found in %s" % filepath)
+
+        self.frm = self.cpj.decode(chunk)
+        self.cache = CpjFrameCache(max_frames)
+        self.prefetch = prefetch
+        self.pending = set()
+        self.current = None
+
+        self.pool = None
+        if prefetch > 0:
+            self.pool = concurrent.futures.ThreadPoolExecutor(max_workers=1)
+
+    def __len__(self):
+        return len(self.frm.frames)
+
+    def decode(self, index):
+        co = self.cache.get(index)
+        if co is None:
+            # positions X Z Y, flattened for foreach_set
+            co = self.frm.positions(index)[:, (0, 2, 1)].astype(
+                numpy.float32).ravel()
+            self.cache.put(index, co)
+        return co
+
+    def prefetch_after(self, index):
+        if self.pool is None:
+            return
+
+        for i in range(index + 1, index + 1 + self.prefetch):
+            i %= len(self)
+            if i not in self.pending and i not in self.cache:
+                self.pending.add(i)
+                self.pool.submit(self.decode_pending, i)
+
+    def decode_pending(self, index):
+        try:
+            self.decode(index)
+        finally:
+            self.pending.discard(index)
+
+    def close(self):
+        if self.pool is not None:
+            self.pool.shutdown(wait=True)
+        self.cache.clear()
+        self.frm = None
+        self.cpj.close()
+
+
+# ----------------------------------------------------------------------------
+streams = {}  # object pointer -> CpjFrameStream or None if file failed
+
+
+# ----------------------------------------------------------------------------
+def attach(bl_object, filepath, chunk, max_frames=64, prefetch=4):
+    """Make object play frames of FRM chunk streamed from file"""
+    log.info("Vertex Frames Chunk (FRM) '%s': streamed from %s",
+             chunk.name, filepath)
+
+    bl_object["cpj_stream_file"] = filepath
+    bl_object["cpj_stream_chunk"] = int32(chunk.offset)
+    bl_object["cpj_stream_cache"] = max_frames
+    bl_object["cpj_stream_prefetch"] = prefetch
+    bl_object["cpj_frame_start"] = bpy.context.scene.frame_start
+
+    update_object(bl_object, bpy.context.scene)
+
+
+# ----------------------------------------------------------------------------
+def get_stream(bl_object):
+    key = bl_object.as_pointer()
+    if key not in streams:
+        try:
+            streams[key] = CpjFrameStream(
+                bpy.path.abspath(bl_object["cpj_stream_file"]),
+                bl_object["cpj_stream_chunk"],
+                bl_object.get("cpj_stream_cache", 64),
+                bl_object.get("cpj_stream_prefetch", 0))
+        except (OSError, ImportError) as e:
+            log.warning("cannot stream frames of '%s': %s", bl_object.name, e)
+            streams[key] = None
+    return streams[key]
+
+
+# ----------------------------------------------------------------------------
+def update_object(bl_object, scene):
+    stream = get_stream(bl_object)
+    if not stream or not len(stream):
+        return
+
+    index = ((scene.frame_current - bl_object.get("cpj_frame_start", 0))
+             % len(stream))
+    if index == stream.current:
+        return
+
+    co = stream.decode(index)
+
+    mesh_data = bl_object.data
+    if len(co) == len(mesh_data.vertices) * 3:
+        mesh_data.vertices.foreach_set("co", co)
+        mesh_data.update()
+
+    stream.current = index
+    stream.prefetch_after(index)
+
+
+# ----------------------------------------------------------------------------
+def detach(bl_object):
+    """Close stream of object, if any"""
+    stream = streams.pop(bl_object.as_pointer(), None)
+    if stream:
+        stream.close()
+
+
+# ----------------------------------------------------------------------------
+def close_all():
+    for stream in streams.values():
+        if stream:
+            stream.close()
+    streams.clear()
+
+
+# ----------------------------------------------------------------------------
+@bpy.app.handlers.persistent
+def on_frame_change(scene, depsgraph=None):
+    for bl_object in scene.objects:
+        if bl_object.type == 'MESH' and "cpj_stream_file" in bl_object:
+            update_object(bl_object, scene)
+
+
+# ----------------------------------------------------------------------------
+@bpy.app.handlers.persistent
+def on_load(*args):
+    close_all()
+
+
+# ----------------------------------------------------------------------------
+def register():
+    bpy.app.handlers.frame_change_post.append(on_frame_change)
+    bpy.app.handlers.load_pre.append(on_load)
+
+
+# ----------------------------------------------------------------------------
+def unregister():
+    if on_frame_change in bpy.app.handlers.frame_change_post:
+        bpy.app.handlers.frame_change_post.remove(on_frame_change)
+    if on_load in bpy.app.handlers.load_pre:
+        bpy.app.handlers.load_pre.remove(on_load)
+    close_all()
+
+
+# EoF